@@ -1,12 +1,49 @@
+import atexit
 import boto3
 import random
 import time
 import uuid
 import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from botocore.config import Config
 from entities import Game, UserGameMapping
 
+# Use orjson for log serialization when it is installed
+try:
+    import orjson
+    
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    dumps = json.dumps
+
+LOG_BUFFER_SIZE = 64 * 1024  # Bytes buffered before the resource usage log is written to disk
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler that writes through a large buffer instead of flushing after every record.
+    The buffer is written to disk when it fills up, on flush() and when the handler is closed.
+    """
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=LOG_BUFFER_SIZE,
+                    encoding=self.encoding, errors=self.errors)
+    
+    def emit(self, record):
+        """Write the record to the buffered stream without flushing it."""
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
 # Configure logging
 # Console logger for application logs
 console_handler = logging.StreamHandler()
@@ -14,10 +51,17 @@ console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
 
 # File logger for JSON logs - only for DynamoDB resource usage
-file_handler = logging.FileHandler("dynamodb_resource_usage.log")
+file_handler = BufferedFileHandler("dynamodb_resource_usage.log")
 file_handler.setLevel(logging.INFO)
 file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))  # Include timestamp in log file
 
+# Hand records to a background thread that owns the file, so logging a record
+# only enqueues it on the calling thread
+log_queue = queue.Queue(-1)
+queue_handler = logging.handlers.QueueHandler(log_queue)
+log_listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+log_listener.start()
+
 # Create separate loggers
 app_logger = logging.getLogger('app')
 app_logger.setLevel(logging.INFO)
@@ -27,21 +71,87 @@ app_logger.propagate = False
 # DynamoDB resource usage logger
 ddb_logger = logging.getLogger('ddb_resources')
 ddb_logger.setLevel(logging.INFO)
-ddb_logger.addHandler(file_handler)
+ddb_logger.addHandler(queue_handler)
 ddb_logger.propagate = False
 
+_resource_logging_stopped = False
+
+def stop_resource_logging():
+    """Drain the queued resource usage records and write them to disk.
+    Safe to call more than once; QueueListener.stop() itself is not.
+    """
+    global _resource_logging_stopped
+    if _resource_logging_stopped:
+        return
+    _resource_logging_stopped = True
+    log_listener.stop()
+    file_handler.flush()
+
+atexit.register(stop_resource_logging)
+
 # For backward compatibility
 logger = app_logger
 
-# Initialize DynamoDB client
-dynamodb = boto3.client('dynamodb')
+# Resolve the region once instead of building a new Session for every log entry
+REGION = boto3.session.Session().region_name
+
+# Initialize DynamoDB client once per process with keep-alive connections,
+# so repeated main() runs reuse the pooled TCP/TLS connections.
+# The pool is sized for the concurrent map fallback. A short connect timeout lets
+# unreachable hosts be retried quickly, while the read timeout stays long enough
+# that the join transaction is not timed out and resent while it is still running.
+DYNAMODB_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=64,
+    connect_timeout=1.0,
+    read_timeout=5.0,
+    retries={'max_attempts': 5, 'mode': 'adaptive'}
+)
+# Pass the cached region and let botocore resolve the endpoint, so other partitions
+# and AWS_ENDPOINT_URL overrides keep working
+dynamodb = boto3.client('dynamodb', region_name=REGION, config=DYNAMODB_CONFIG)
+
+# Optionally serve the open-games lookup from a DAX cluster (opt-in via DAX_ENDPOINT).
+# Writes always go straight to DynamoDB.
+DAX_ENDPOINT = os.environ.get('DAX_ENDPOINT')
+if DAX_ENDPOINT:
+    from amazondax import AmazonDaxClient
+    query_client = AmazonDaxClient(endpoint_url=DAX_ENDPOINT, region_name=REGION)
+else:
+    query_client = dynamodb
+
+# Open the connection at import time so the first request of main() does not pay
+# for the TCP/TLS handshake and endpoint discovery
+try:
+    dynamodb.describe_endpoints()
+except Exception:
+    pass  # Pre-warm only; don't fail the import in environments without IAM access
 
 # Constants
 TABLE_NAME = "battle-royale"
 MODULE_NAME = "join-game"
 MAX_PLAYERS = 500
+FALLBACK_WORKERS = 8  # Concurrent map queries when the selected map has no open games
+MAX_FALLBACK_ERRORS = 3  # Consecutive failed map queries before the fallback gives up
+USER_SCAN_SEGMENTS = 64  # Logical scan segments; users are sampled from one random segment
+USER_SAMPLE_SIZE = 10  # Users cached from the scanned segment
+USER_SCAN_PAGE_LIMIT = 100  # Items read per scan page, before the user filter is applied
+MAX_USER_SCAN_PAGES = 20  # Scan pages read from the segment before giving up
+READ_OPERATION_PREFIXES = ('get_', 'query_', 'scan_')  # Operations billed as RCU
+
+# Request fragments that never change, built once instead of on every request
+OPEN_GAMES_ATTRIBUTE_NAMES = {
+    "#map": "map"  # Use expression attribute names to handle reserved keywords
+}
+JOIN_PUT_CONDITION = "attribute_not_exists(SK)"
+JOIN_UPDATE_EXPRESSION = "SET people = people + :p"
+JOIN_UPDATE_CONDITION = "people <= :limit"
+JOIN_UPDATE_VALUES = {
+    ":p": {"N": "1"},
+    ":limit": {"N": str(MAX_PLAYERS - 1)}
+}
 # Available maps list
-MAPS = [
+MAPS = (
     "Green Grasslands", "Dirty Desert", "Urban Underground", "Juicy Jungle", "Open Ocean",
     "Mystic Mountains", "Frozen Frontier", "Volcanic Valley", "Haunted Hills", "Sunny Shores",
     "Cosmic Crater", "Ancient Ruins", "Neon City", "Foggy Forest", "Crystal Caves",
@@ -52,13 +162,20 @@ MAPS = [
     "Jade Jungle", "Karst Kingdom", "Lunar Landscape", "Midnight Meadow", "Nebula Nexus",
     "Obsidian Outpost", "Prismatic Plains", "Quantum Quarry", "Ruby Ridge", "Sapphire Springs",
     "Twilight Temple", "Umbra Uplands", "Verdant Valley", "Whispering Woods", "Xenon Xanadu"
-]
+)
+# Fallback maps to try for each selected map
+OTHER_MAPS = {selected: tuple(m for m in MAPS if m != selected) for selected in MAPS}
+
+# Random generator used for all selections in this module
+_RNG = random.Random()
 
 class ResourceTracker:
     """
     Class to track and accumulate DynamoDB resource consumption across multiple operations.
+    Each main() run creates its own tracker and passes it to the functions it calls.
     """
     def __init__(self):
+        self._lock = threading.Lock()  # Guards updates from concurrent map queries
         self.reset()
     
     def reset(self):
@@ -66,7 +183,7 @@ class ResourceTracker:
         self.total_rcu = 0
         self.total_wcu = 0
         self.table_consumption = {'rcu': 0, 'wcu': 0}  # Track base table consumption
-        self.gsi_consumption = {}  # Track GSI consumption separately
+        self.gsi_consumption = defaultdict(lambda: {'rcu': 0, 'wcu': 0})  # Track GSI consumption separately
         self.operations = []
         self.start_time = time.time()
         self.status = "success"
@@ -75,33 +192,60 @@ class ResourceTracker:
     def add_consumption(self, operation, consumed_capacity):
         """
         Add resource consumption from an operation to the total.
+        Safe to call from multiple threads.
         
         Parameters:
         - operation: The operation name
         - consumed_capacity: The consumed capacity information from DynamoDB
         """
+        with self._lock:
+            self._add_consumption(operation, consumed_capacity)
+    
+    def _add_consumption(self, operation, consumed_capacity):
+        """Accumulate consumed capacity. Callers must hold the tracker lock."""
         # Handle case where consumed_capacity might be None
         if consumed_capacity is None:
             self.operations.append(operation)
             return
         
+        # Classify the operation once - reads are counted as RCU, everything else as WCU
+        is_read = operation.startswith(READ_OPERATION_PREFIXES)
+        
+        def route(capacity_units):
+            """Split a combined CapacityUnits value into an (rcu, wcu) pair."""
+            return (capacity_units, 0) if is_read else (0, capacity_units)
+        
+        # Accumulate into locals and write the totals back once at the end
+        total_rcu = self.total_rcu
+        total_wcu = self.total_wcu
+        table_consumption = self.table_consumption
+        gsi_consumption = self.gsi_consumption
+        
         if isinstance(consumed_capacity, dict):
             # For single operations
-            # Get base table consumption directly from DynamoDB response
-            table_rcu = consumed_capacity.get('Table', {}).get('ReadCapacityUnits', 0)
-            table_wcu = consumed_capacity.get('Table', {}).get('WriteCapacityUnits', 0)
+            # Fast path: only a total CapacityUnits was returned, with no table/GSI breakdown
+            if 'Table' not in consumed_capacity and 'GlobalSecondaryIndexes' not in consumed_capacity:
+                capacity_rcu, capacity_wcu = route(consumed_capacity.get('CapacityUnits', 0))
+                self.total_rcu = total_rcu + capacity_rcu
+                self.total_wcu = total_wcu + capacity_wcu
+                self.operations.append(operation)
+                return
             
-            # If Table doesn't have separate RCU/WCU, check for CapacityUnits
-            if table_rcu == 0 and table_wcu == 0 and 'Table' in consumed_capacity:
-                table_capacity = consumed_capacity['Table'].get('CapacityUnits', 0)
-                if operation.startswith('get_') or operation.startswith('query_') or operation.startswith('scan_'):
-                    table_rcu = table_capacity
-                else:
-                    table_wcu = table_capacity
+            # Get base table consumption directly from DynamoDB response
+            table = consumed_capacity.get('Table')
+            if table:
+                table_rcu = table.get('ReadCapacityUnits', 0)
+                table_wcu = table.get('WriteCapacityUnits', 0)
+                
+                # If Table doesn't have separate RCU/WCU, check for CapacityUnits
+                if table_rcu == 0 and table_wcu == 0:
+                    table_rcu, table_wcu = route(table.get('CapacityUnits', 0))
+            else:
+                table_rcu = table_wcu = 0
             
             # Update table consumption
-            self.table_consumption['rcu'] += table_rcu
-            self.table_consumption['wcu'] += table_wcu
+            table_consumption['rcu'] += table_rcu
+            table_consumption['wcu'] += table_wcu
             
             # Track GSI consumption if available
             gsi_rcu_total = 0
@@ -113,17 +257,11 @@ class ResourceTracker:
                     
                     # If GSI doesn't have separate RCU/WCU, check for CapacityUnits
                     if gsi_rcu == 0 and gsi_wcu == 0:
-                        gsi_capacity = gsi_data.get('CapacityUnits', 0)
-                        if operation.startswith('get_') or operation.startswith('query_') or operation.startswith('scan_'):
-                            gsi_rcu = gsi_capacity
-                        else:
-                            gsi_wcu = gsi_capacity
-                    
-                    if gsi_name not in self.gsi_consumption:
-                        self.gsi_consumption[gsi_name] = {'rcu': 0, 'wcu': 0}
+                        gsi_rcu, gsi_wcu = route(gsi_data.get('CapacityUnits', 0))
                     
-                    self.gsi_consumption[gsi_name]['rcu'] += gsi_rcu
-                    self.gsi_consumption[gsi_name]['wcu'] += gsi_wcu
+                    gsi_usage = gsi_consumption[gsi_name]
+                    gsi_usage['rcu'] += gsi_rcu
+                    gsi_usage['wcu'] += gsi_wcu
                     
                     gsi_rcu_total += gsi_rcu
                     gsi_wcu_total += gsi_wcu
@@ -131,43 +269,33 @@ class ResourceTracker:
             # Add to total consumption - directly from DynamoDB's total or sum of components
             if 'CapacityUnits' in consumed_capacity:
                 # If DynamoDB provides a total, use it
-                capacity_units = consumed_capacity.get('CapacityUnits', 0)
-                if operation.startswith('get_') or operation.startswith('query_') or operation.startswith('scan_'):
-                    self.total_rcu += capacity_units
-                else:
-                    self.total_wcu += capacity_units
+                capacity_rcu, capacity_wcu = route(consumed_capacity.get('CapacityUnits', 0))
+                total_rcu += capacity_rcu
+                total_wcu += capacity_wcu
             else:
                 # Otherwise sum the components
-                self.total_rcu += table_rcu + gsi_rcu_total
-                self.total_wcu += table_wcu + gsi_wcu_total
+                total_rcu += table_rcu + gsi_rcu_total
+                total_wcu += table_wcu + gsi_wcu_total
         
         elif isinstance(consumed_capacity, list):
             # For transactional operations
-            total_table_rcu = 0
-            total_table_wcu = 0
-            total_gsi_rcu = 0
-            total_gsi_wcu = 0
-            
             for item in consumed_capacity:
                 if isinstance(item, dict):  # Ensure item is a dictionary
                     # Get base table consumption directly from DynamoDB response
-                    table_rcu = item.get('Table', {}).get('ReadCapacityUnits', 0)
-                    table_wcu = item.get('Table', {}).get('WriteCapacityUnits', 0)
-                    
-                    # If Table doesn't have separate RCU/WCU, check for CapacityUnits
-                    if table_rcu == 0 and table_wcu == 0 and 'Table' in item:
-                        table_capacity = item['Table'].get('CapacityUnits', 0)
-                        if operation.startswith('get_') or operation.startswith('query_') or operation.startswith('scan_'):
-                            table_rcu = table_capacity
-                        else:
-                            table_wcu = table_capacity
+                    table = item.get('Table')
+                    if table:
+                        table_rcu = table.get('ReadCapacityUnits', 0)
+                        table_wcu = table.get('WriteCapacityUnits', 0)
+                        
+                        # If Table doesn't have separate RCU/WCU, check for CapacityUnits
+                        if table_rcu == 0 and table_wcu == 0:
+                            table_rcu, table_wcu = route(table.get('CapacityUnits', 0))
+                    else:
+                        table_rcu = table_wcu = 0
                     
                     # Update table consumption
-                    self.table_consumption['rcu'] += table_rcu
-                    self.table_consumption['wcu'] += table_wcu
-                    
-                    total_table_rcu += table_rcu
-                    total_table_wcu += table_wcu
+                    table_consumption['rcu'] += table_rcu
+                    table_consumption['wcu'] += table_wcu
                     
                     # Track GSI consumption for transactional operations
                     if 'GlobalSecondaryIndexes' in item:
@@ -177,29 +305,18 @@ class ResourceTracker:
                             
                             # If GSI doesn't have separate RCU/WCU, check for CapacityUnits
                             if gsi_rcu == 0 and gsi_wcu == 0:
-                                gsi_capacity = gsi_data.get('CapacityUnits', 0)
-                                if operation.startswith('get_') or operation.startswith('query_') or operation.startswith('scan_'):
-                                    gsi_rcu = gsi_capacity
-                                else:
-                                    gsi_wcu = gsi_capacity
-                            
-                            if gsi_name not in self.gsi_consumption:
-                                self.gsi_consumption[gsi_name] = {'rcu': 0, 'wcu': 0}
+                                gsi_rcu, gsi_wcu = route(gsi_data.get('CapacityUnits', 0))
                             
-                            self.gsi_consumption[gsi_name]['rcu'] += gsi_rcu
-                            self.gsi_consumption[gsi_name]['wcu'] += gsi_wcu
-                            
-                            total_gsi_rcu += gsi_rcu
-                            total_gsi_wcu += gsi_wcu
+                            gsi_usage = gsi_consumption[gsi_name]
+                            gsi_usage['rcu'] += gsi_rcu
+                            gsi_usage['wcu'] += gsi_wcu
                     
                     # Add to total consumption - directly from DynamoDB's total or sum of components
                     if 'CapacityUnits' in item:
                         # If DynamoDB provides a total, use it
-                        capacity_units = item.get('CapacityUnits', 0)
-                        if operation.startswith('get_') or operation.startswith('query_') or operation.startswith('scan_'):
-                            self.total_rcu += capacity_units
-                        else:
-                            self.total_wcu += capacity_units
+                        capacity_rcu, capacity_wcu = route(item.get('CapacityUnits', 0))
+                        total_rcu += capacity_rcu
+                        total_wcu += capacity_wcu
                     else:
                         # For this item, add the components to the total
                         item_rcu = table_rcu
@@ -207,13 +324,17 @@ class ResourceTracker:
                         
                         # Add GSI consumption for this item
                         if 'GlobalSecondaryIndexes' in item:
-                            for gsi_name, gsi_data in item['GlobalSecondaryIndexes'].items():
-                                item_rcu += gsi_data.get('ReadCapacityUnits', 0) or gsi_data.get('CapacityUnits', 0) if operation.startswith('get_') or operation.startswith('query_') or operation.startswith('scan_') else 0
-                                item_wcu += gsi_data.get('WriteCapacityUnits', 0) or gsi_data.get('CapacityUnits', 0) if not (operation.startswith('get_') or operation.startswith('query_') or operation.startswith('scan_')) else 0
+                            for gsi_data in item['GlobalSecondaryIndexes'].values():
+                                if is_read:
+                                    item_rcu += gsi_data.get('ReadCapacityUnits', 0) or gsi_data.get('CapacityUnits', 0)
+                                else:
+                                    item_wcu += gsi_data.get('WriteCapacityUnits', 0) or gsi_data.get('CapacityUnits', 0)
                         
-                        self.total_rcu += item_rcu
-                        self.total_wcu += item_wcu
+                        total_rcu += item_rcu
+                        total_wcu += item_wcu
         
+        self.total_rcu = total_rcu
+        self.total_wcu = total_wcu
         self.operations.append(operation)
     
     def set_error(self, error_msg):
@@ -225,29 +346,28 @@ class ResourceTracker:
         """Get total latency in milliseconds."""
         return (time.time() - self.start_time) * 1000
 
-# Create global resource tracker
-resource_tracker = ResourceTracker()
+# User IDs sampled from the table, reused across runs
+_USER_CACHE = []
 
-def get_open_games_by_map(map_name):
+def get_open_games_by_map(map_name, tracker):
     """
     Get open games by map name using the OpenGamesIndex GSI.
     Returns games for the specified map using the map as partition key
-    and open_timestamp as sort key.
+    and open_timestamp as sort key, or None if the query failed.
     
     Parameters:
     - map_name: The map name to query
+    - tracker: The ResourceTracker for the current run
     """
     try:
         # Use query with OpenGamesIndex GSI to find open games for the specified map
-        logger.info(f"Querying for open games on map '{map_name}' using OpenGamesIndex GSI...")
+        logger.info("Querying for open games on map '%s' using OpenGamesIndex GSI...", map_name)
         
         query_params = {
             "TableName": TABLE_NAME,
             "IndexName": "OpenGamesIndex",
             "KeyConditionExpression": "#map = :map_val",
-            "ExpressionAttributeNames": {
-                "#map": "map"  # Use expression attribute names to handle reserved keywords
-            },
+            "ExpressionAttributeNames": OPEN_GAMES_ATTRIBUTE_NAMES,
             "ExpressionAttributeValues": {
                 ":map_val": {"S": map_name}
             },
@@ -255,65 +375,102 @@ def get_open_games_by_map(map_name):
         }
         
         # Execute query
-        response = dynamodb.query(**query_params)
+        response = query_client.query(**query_params)
         
         # Add consumed capacity to tracker
         if 'ConsumedCapacity' in response:
             consumed_capacity = response['ConsumedCapacity']
-            # Log raw consumed capacity for debugging
-            app_logger.info(f"Raw ConsumedCapacity for query_open_games_map_{map_name}: {json.dumps(consumed_capacity, indent=2)}")
-            resource_tracker.add_consumption(f"query_open_games_map_{map_name}", consumed_capacity)
+            # Log raw consumed capacity for debugging (skip the JSON encoding unless DEBUG is enabled)
+            if app_logger.isEnabledFor(logging.DEBUG):
+                app_logger.debug("Raw ConsumedCapacity for %s: %s",
+                                 f"query_open_games_map_{map_name}", dumps(consumed_capacity))
+            tracker.add_consumption(f"query_open_games_map_{map_name}", consumed_capacity)
         else:
             # Just record that the operation happened
-            resource_tracker.operations.append(f"query_open_games_map_{map_name}")
+            tracker.add_consumption(f"query_open_games_map_{map_name}", None)
         
         # Process results
         games = response.get('Items', [])
-        logger.info(f"Found {len(games)} open games on map '{map_name}'")
+        logger.info("Found %d open games on map '%s'", len(games), map_name)
         
         return games
     except Exception as e:
-        resource_tracker.set_error(str(e))
-        logger.error(f"Error querying games: {str(e)}")
-        return []
+        tracker.set_error(str(e))
+        logger.error("Error querying games: %s", e)
+        return None
 
 def get_random_user_from_table():
     """
-    Query users from the DynamoDB table and return a random user ID.
+    Return a random user ID from a small pool of users sampled from the DynamoDB table.
+    The pool is filled by a bounded scan on the first call and reused by later calls,
+    so the scan is not repeated on every run.
     This function does not track DynamoDB resource consumption.
     """
+    if _USER_CACHE:
+        user_id = _RNG.choice(_USER_CACHE)
+        logger.info("Selected random user from cache: %s", user_id)
+        return user_id
+    
     try:
-        # Query users from the table
-        response = dynamodb.scan(
-            TableName=TABLE_NAME,
-            FilterExpression="begins_with(PK, :pk_prefix) AND begins_with(SK, :sk_prefix)",
-            ExpressionAttributeValues={
+        # Query users from a random segment of the table, so the sample is not
+        # always the first users returned from the start of the keyspace.
+        # Limit is applied before the filter, so a page may hold no users at all;
+        # keep paging through the segment until enough users are found.
+        scan_kwargs = {
+            "TableName": TABLE_NAME,
+            "FilterExpression": "begins_with(PK, :pk_prefix) AND begins_with(SK, :sk_prefix)",
+            "ExpressionAttributeValues": {
                 ":pk_prefix": {"S": "USER#"},
                 ":sk_prefix": {"S": "#METADATA#"}
             },
-            ProjectionExpression="PK",
-            Limit=10  # Limit to 10 users for efficiency
-        )
-        
-        users = response.get('Items', [])
+            "ProjectionExpression": "PK",
+            "Limit": USER_SCAN_PAGE_LIMIT,
+            "Segment": _RNG.randrange(USER_SCAN_SEGMENTS),
+            "TotalSegments": USER_SCAN_SEGMENTS
+        }
+        users = []
+        for _ in range(MAX_USER_SCAN_PAGES):
+            response = dynamodb.scan(**scan_kwargs)
+            users.extend(response.get('Items', []))
+            if len(users) >= USER_SAMPLE_SIZE or 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs["ExclusiveStartKey"] = response['LastEvaluatedKey']
         
         if not users:
-            logger.warning("No users found in the table, generating a random user ID instead")
+            logger.warning("No users found in scan segment %d, falling back to a random user ID",
+                           scan_kwargs["Segment"])
             return f"user_{uuid.uuid4().hex[:8]}"
         
+        # Cache the sampled users for later calls
+        _USER_CACHE.extend(item['PK']['S'][5:] for item in users[:USER_SAMPLE_SIZE])  # Remove 'USER#' prefix
+        
         # Select a random user
-        selected_user = random.choice(users)
-        user_id = selected_user['PK']['S'].replace('USER#', '')
+        user_id = _RNG.choice(_USER_CACHE)
         
-        logger.info(f"Selected random user: {user_id}")
+        logger.info("Selected random user: %s", user_id)
         return user_id
         
     except Exception as e:
-        logger.error(f"Error fetching users from table: {str(e)}")
+        logger.error("Error fetching users from table, falling back to a random user ID: %s", e)
         # Fallback to generating a random user ID
         return f"user_{uuid.uuid4().hex[:8]}"
 
-def join_game_for_user(game_data, username):
+def record_consumed_capacity(tracker, operation, response):
+    """
+    Add the consumed capacity of a DynamoDB response to the tracker.
+    
+    Parameters:
+    - tracker: The ResourceTracker for the current run
+    - operation: The operation name
+    - response: The DynamoDB response
+    """
+    consumed_capacity = response.get('ConsumedCapacity')
+    # Log raw consumed capacity for debugging when DEBUG is enabled
+    if consumed_capacity is not None and app_logger.isEnabledFor(logging.DEBUG):
+        app_logger.debug("Raw ConsumedCapacity for %s: %s", operation, dumps(consumed_capacity))
+    tracker.add_consumption(operation, consumed_capacity)
+
+def join_game_for_user(game_data, username, tracker):
     """
     Add a user to a game and track DynamoDB resource consumption.
     Uses game data directly from query operation.
@@ -321,6 +478,7 @@ def join_game_for_user(game_data, username):
     Parameters:
     - game_data: The game data from query operation
     - username: The username to add to the game
+    - tracker: The ResourceTracker for the current run
     """
     try:
         # Extract game ID from the game data
@@ -334,12 +492,14 @@ def join_game_for_user(game_data, username):
         
         if not game_id:
             logger.error("Could not determine game ID from game data")
-            resource_tracker.set_error("Could not determine game ID")
+            tracker.set_error("Could not determine game ID")
             return False
         
-        logger.info(f"Attempting to join user {username} to game {game_id}")
+        logger.info("Attempting to join user %s to game %s", username, game_id)
         
-        # Use transact_write_items to add user to game
+        # Use transact_write_items to add user to game. The membership Put and the
+        # player-count Update must succeed or fail together; botocore sends a
+        # ClientRequestToken, so a retried transaction is not applied twice.
         try:
             response = dynamodb.transact_write_items(
                 TransactItems=[
@@ -352,7 +512,7 @@ def join_game_for_user(game_data, username):
                                 "game_id": {"S": game_id},
                                 "username": {"S": username}
                             },
-                            "ConditionExpression": "attribute_not_exists(SK)"
+                            "ConditionExpression": JOIN_PUT_CONDITION
                         },
                     },
                     {
@@ -362,144 +522,148 @@ def join_game_for_user(game_data, username):
                                 "PK": {"S": f"GAME#{game_id}"},
                                 "SK": {"S": f"#METADATA#{game_id}"},
                             },
-                            "UpdateExpression": "SET people = people + :p",
-                            "ConditionExpression": "people <= :limit",
-                            "ExpressionAttributeValues": {
-                                ":p": {"N": "1"},
-                                ":limit": {"N": str(MAX_PLAYERS - 1)}
-                            }
+                            "UpdateExpression": JOIN_UPDATE_EXPRESSION,
+                            "ConditionExpression": JOIN_UPDATE_CONDITION,
+                            "ExpressionAttributeValues": JOIN_UPDATE_VALUES
                         }
                     }
                 ],
                 ReturnConsumedCapacity="INDEXES"  # Track both table and GSI consumption
             )
+            record_consumed_capacity(tracker, "join_game_transaction", response)
             
-            # Add consumed capacity to tracker if available
-            if 'ConsumedCapacity' in response:
-                consumed_capacity = response['ConsumedCapacity']
-                # Log raw consumed capacity for debugging - print full details
-                app_logger.info(f"Raw ConsumedCapacity for join_game_transaction (FULL DETAILS): {json.dumps(consumed_capacity, indent=2)}")
-                resource_tracker.add_consumption("join_game_transaction", consumed_capacity)
-            else:
-                # Just record that the operation happened
-                resource_tracker.operations.append("join_game_transaction")
-            
-            logger.info(f"Successfully added user {username} to game {game_id}")
+            logger.info("Successfully added user %s to game %s", username, game_id)
             return True
             
         except Exception as transaction_error:
-            logger.error(f"Transaction error: {str(transaction_error)}")
-            resource_tracker.set_error(f"Transaction error: {str(transaction_error)}")
+            logger.error("Transaction error: %s", transaction_error)
+            tracker.set_error(f"Transaction error: {str(transaction_error)}")
             return False
             
     except Exception as e:
-        resource_tracker.set_error(str(e))
-        logger.error(f"Could not add user to game: {str(e)}")
+        tracker.set_error(str(e))
+        logger.error("Could not add user to game: %s", e)
         return False
 
-def log_resource_usage(user_id):
+def log_resource_usage(user_id, tracker):
     """
     Log accumulated DynamoDB resource consumption for the entire join-game module
     
     Parameters:
     - user_id: The user ID
+    - tracker: The ResourceTracker for the current run
     """
     timestamp = datetime.now().isoformat()
     
     # Calculate total resource consumption from both steps: finding games and joining game
-    total_rcu = resource_tracker.total_rcu
-    total_wcu = resource_tracker.total_wcu
+    total_rcu = tracker.total_rcu
+    total_wcu = tracker.total_wcu
     
     # Create log entry with accumulated resource usage
     log_entry = {
         "timestamp": timestamp,
         "module": MODULE_NAME,
-        "operations": resource_tracker.operations,
+        "operations": tracker.operations,
         "user_id": user_id,
         "rcu": total_rcu,
         "wcu": total_wcu,
         "table": TABLE_NAME,
-        "status": resource_tracker.status,
-        "latency_ms": resource_tracker.get_latency_ms(),
-        "region": boto3.session.Session().region_name,
-        "request_id": str(uuid.uuid4())
+        "status": tracker.status,
+        "latency_ms": tracker.get_latency_ms(),
+        "region": REGION,
+        "request_id": uuid.uuid4().hex
     }
     
     # Add base table consumption information
-    log_entry["table_usage"] = resource_tracker.table_consumption
+    log_entry["table_usage"] = tracker.table_consumption
     
     # Add GSI consumption information if available
-    if resource_tracker.gsi_consumption:
-        log_entry["gsi_usage"] = resource_tracker.gsi_consumption
+    if tracker.gsi_consumption:
+        log_entry["gsi_usage"] = tracker.gsi_consumption
     
     # Add error information if available
-    if resource_tracker.error:
-        log_entry["error"] = resource_tracker.error
+    if tracker.error:
+        log_entry["error"] = tracker.error
     
     # Log only to the DynamoDB resource logger
-    ddb_logger.info(json.dumps(log_entry))
+    ddb_logger.info(dumps(log_entry))
 
 def main():
     """
     Main function: Randomly select a map, query for open games on that map using OpenGamesIndex GSI,
     and join a user to a game while recording resource usage.
     """
-    # Reset resource tracker at the beginning
-    resource_tracker.reset()
+    # Create a fresh resource tracker for this run
+    tracker = ResourceTracker()
     
     try:
         # Randomly select a map
-        selected_map = random.choice(MAPS)
-        logger.info(f"Randomly selected map: {selected_map}")
+        selected_map = _RNG.choice(MAPS)
+        logger.info("Randomly selected map: %s", selected_map)
         
         # Get open games on the selected map using OpenGamesIndex GSI
-        open_games = get_open_games_by_map(selected_map)
+        open_games = get_open_games_by_map(selected_map, tracker)
         
         # If no open games on the current map, try other maps
         if not open_games:
-            logger.warning(f"No open games found on map '{selected_map}'")
+            logger.warning("No open games found on map '%s'", selected_map)
             
-            # Try other maps
+            # Try other maps concurrently and take the first map that has open games
             logger.info("Trying to find open games on other maps...")
-            for map_name in MAPS:
-                if map_name != selected_map:
-                    open_games = get_open_games_by_map(map_name)
-                    if open_games:
-                        logger.info(f"Found open games on map '{map_name}'")
+            # Give up early on repeated query errors instead of spending RCU on every map
+            consecutive_errors = 1 if open_games is None else 0
+            with ThreadPoolExecutor(max_workers=FALLBACK_WORKERS) as executor:
+                futures = {executor.submit(get_open_games_by_map, map_name, tracker): map_name
+                           for map_name in OTHER_MAPS[selected_map]}
+                for future in as_completed(futures):
+                    games = future.result()
+                    if games:
+                        open_games = games
+                        logger.info("Found open games on map '%s'", futures[future])
                         break
+                    if games is None:
+                        consecutive_errors += 1
+                        if consecutive_errors >= MAX_FALLBACK_ERRORS:
+                            logger.error("Stopping map fallback after %d consecutive query errors", consecutive_errors)
+                            break
+                    else:
+                        consecutive_errors = 0
+                # Skip queries that have not started yet
+                for future in futures:
+                    future.cancel()
         
         # If no open games on any map, log and exit
         if not open_games:
             logger.warning("No open games found on any map")
-            resource_tracker.set_error("No open games available")
-            log_resource_usage("N/A")
+            tracker.set_error("No open games available")
+            log_resource_usage("N/A", tracker)
             return
         
         # Randomly select a game from the available open games
-        selected_game = random.choice(open_games)
-        logger.info(f"Randomly selected 1 game from {len(open_games)} available games")
+        selected_game = _RNG.choice(open_games)
+        logger.info("Randomly selected 1 game from %d available games", len(open_games))
         
         # Get a random user ID from the table (not tracking resource consumption)
         user_id = get_random_user_from_table()
         
         # Join the game - pass the entire game data from query operation
-        success = join_game_for_user(selected_game, user_id)
+        success = join_game_for_user(selected_game, user_id, tracker)
         
         # If successful, reset any error state
         if success:
-            resource_tracker.status = "success"
-            resource_tracker.error = None
-            logger.info(f"Successfully joined user {user_id} to game")
+            tracker.status = "success"
+            tracker.error = None
+            logger.info("Successfully joined user %s to game", user_id)
         else:
-            logger.error(f"Failed to join user {user_id} to game")
+            logger.error("Failed to join user %s to game", user_id)
         
         # Log the accumulated resource usage for the entire process
-        log_resource_usage(user_id)
+        log_resource_usage(user_id, tracker)
         
     except Exception as e:
-        logger.error(f"Unexpected error in main function: {str(e)}")
-        resource_tracker.set_error(f"Unexpected error: {str(e)}")
-        log_resource_usage("error")
+        logger.error("Unexpected error in main function: %s", e)
+        tracker.set_error(f"Unexpected error: {str(e)}")
+        log_resource_usage("error", tracker)
 
 if __name__ == "__main__":
     main()
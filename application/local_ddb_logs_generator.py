@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
+import array
 import json
 import time
 import random
 import datetime
-import uuid
 import threading
 import logging
 import sys
 import os
+import queue
+
+# Use orjson to encode log entries when it is installed
+try:
+    import orjson
+    
+    def encode_log_line(log):
+        """Encode a log entry as one UTF-8 NDJSON line, including the trailing newline."""
+        return orjson.dumps(log, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    def encode_log_line(log):
+        """Encode a log entry as one UTF-8 NDJSON line, including the trailing newline."""
+        return (json.dumps(log) + '\n').encode()
 
 # Configure logging
 logging.basicConfig(
@@ -19,14 +32,25 @@ logging.basicConfig(
 )
 
 # Constants for log generation
-USERS = ["linda1130", "potterantonio938", "spencerjohnson431", "ryan2152", "todd04710", "jamie04997"]
-MAPS = ["Twilight Temple", "Icy Islands", "Lava Lakes", "Radiant Reef", "Toxic Tundra", 
+USERS = ("linda1130", "potterantonio938", "spencerjohnson431", "ryan2152", "todd04710", "jamie04997")
+MAPS = ("Twilight Temple", "Icy Islands", "Lava Lakes", "Radiant Reef", "Toxic Tundra", 
         "Midnight Meadow", "Emerald Estuary", "Prismatic Plains", "Cosmic Crater", 
         "Green Grasslands", "Neon City", "Nebula Nexus", "Deadly Dunes", "Jade Jungle", 
-        "Dusty Docks", "Umbra Uplands"]
+        "Dusty Docks", "Umbra Uplands")
 TABLE_NAME = "battle-royale"
 REGION = "us-east-1"
 
+# Log entry parts that never change, built once and shared by every generated entry
+JOIN_GAME_OPERATIONS = {
+    map_name: ("query_open_games_map_" + map_name.replace(' ', '_'), "join_game_transaction") for map_name in MAPS
+}
+QUERY_USER_OPERATIONS = {
+    user_id: ("query_user_games_" + user_id, "get_game_details_batch_0") for user_id in USERS
+}
+JOIN_GAME_TABLE_USAGE = {"rcu": 0.0, "wcu": 4.0}
+JOIN_GAME_INVERTED_INDEX_USAGE = {"rcu": 0, "wcu": 2.0}
+QUERY_USER_GSI_USAGE = {"InvertedIndex": {"rcu": 0.5, "wcu": 0}}
+
 # Local file paths for storing logs
 LOG_DIR = os.path.join(os.environ.get('HOME'), 'logs')
 NDJSON_LOG_FILE = os.path.join(LOG_DIR, "ddb_resource_logs.ndjson")
@@ -34,15 +58,51 @@ NDJSON_LOG_FILE = os.path.join(LOG_DIR, "ddb_resource_logs.ndjson")
 # Simulation parameters
 CALLS_PER_SECOND = 5  # 5 calls per second for each module
 BATCH_SIZE = 10  # Number of logs to batch before writing to file
+MAX_BATCH_DELAY = 0.5  # Seconds a buffered log may wait before the batch is written anyway
+MAX_WRITE_BATCH = 1000  # Most logs written with one write call when the writer falls behind
+RANDOM_BATCH_SIZE = 1024  # Number of random values pre-generated at a time
+LOG_FILE_BUFFER_SIZE = 128 * 1024  # Write buffer of the NDJSON file handle
+
+# Generated logs waiting for the writer thread, shared by both generator threads
+log_queue = queue.SimpleQueue()
+STOP_WRITER = None  # Queued by main() on shutdown; the writer exits once it has written everything before it
+
+# Random generator used to fill the batches of random values
+rng = random.Random()
+
+# NDJSON file handle owned by the writer thread, opened once in main()
+log_fh = None
 
 # Statistics counters
-stats = {
-    "join_game_logs_generated": 0,
-    "query_user_logs_generated": 0,
-    "successful_writes": 0,
-    "failed_writes": 0,
-    "start_time": time.time()
-}
+# Each thread increments only its own counters; readers take an unsynchronized
+# snapshot summed over all threads, which may lag the writers slightly
+START_TIME = time.time()
+STAT_NAMES = ("join_game_logs_generated", "query_user_logs_generated", "successful_writes", "failed_writes")
+JOIN_GAME_LOGS_GENERATED, QUERY_USER_LOGS_GENERATED, SUCCESSFUL_WRITES, FAILED_WRITES = range(len(STAT_NAMES))
+thread_stats = []  # Counters of every thread that has recorded statistics
+thread_stats_lock = threading.Lock()  # Only taken when a thread registers its counters
+thread_local = threading.local()
+
+def get_thread_stats():
+    """Return the calling thread's statistics counters, registering them on first use"""
+    counters = getattr(thread_local, 'stats', None)
+    if counters is None:
+        # One unsigned 64-bit slot per statistic, indexed by the constants above
+        counters = array.array('Q', bytes(8 * len(STAT_NAMES)))
+        thread_local.stats = counters
+        with thread_stats_lock:
+            thread_stats.append(counters)
+    return counters
+
+def snapshot_stats():
+    """Return all statistics summed over all threads, read once without locking"""
+    sums = [0] * len(STAT_NAMES)
+    for counters in list(thread_stats):
+        for index, value in enumerate(counters):
+            sums[index] += value
+    totals = dict(zip(STAT_NAMES, sums))
+    totals["total_logs_generated"] = totals["join_game_logs_generated"] + totals["query_user_logs_generated"]
+    return totals
 
 def ensure_log_directory():
     """Ensure the log directory exists"""
@@ -50,30 +110,87 @@ def ensure_log_directory():
         os.makedirs(LOG_DIR)
         logging.info(f"Created log directory: {LOG_DIR}")
 
+def open_log_file():
+    """Open the NDJSON log file once in append mode (O_APPEND keeps each write at the end of the file)"""
+    global log_fh
+    fd = os.open(NDJSON_LOG_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    log_fh = os.fdopen(fd, 'ab', buffering=LOG_FILE_BUFFER_SIZE)
+
+class RandomBatch:
+    """Pre-generates random values in batches and hands them out one at a time"""
+    def __init__(self, generate_batch):
+        self.generate_batch = generate_batch
+        self.values = []
+    
+    def next(self):
+        """Return the next value, generating a new batch when the current one is used up"""
+        if not self.values:
+            self.values = self.generate_batch(RANDOM_BATCH_SIZE)
+        return self.values.pop()
+
+def uniform_batch(low, high, ndigits):
+    """Return a batch generator of uniform values between low and high, rounded to ndigits"""
+    def generate(n):
+        uniform = rng.uniform
+        return [round(uniform(low, high), ndigits) for _ in range(n)]
+    return generate
+
+def request_id_batch(n):
+    """Generate n random 32-character hex request IDs from a single os.urandom() call"""
+    data = os.urandom(16 * n).hex()
+    return [data[i:i + 32] for i in range(0, 32 * n, 32)]
+
+# Random values for each module's generator. Each generator runs on its own
+# thread and only draws from its own batches.
+join_game_users = RandomBatch(lambda n: rng.choices(USERS, k=n))
+join_game_maps = RandomBatch(lambda n: rng.choices(MAPS, k=n))
+join_game_rcus = RandomBatch(uniform_batch(60.0, 66.0, 1))
+join_game_latencies = RandomBatch(uniform_batch(95.0, 145.0, 8))
+join_game_request_ids = RandomBatch(request_id_batch)
+query_user_users = RandomBatch(lambda n: rng.choices(USERS, k=n))
+query_user_rcus = RandomBatch(uniform_batch(2.0, 4.0, 1))
+query_user_latencies = RandomBatch(uniform_batch(55.0, 70.0, 8))
+query_user_request_ids = RandomBatch(request_id_batch)
+
+# Last formatted timestamp as (epoch milliseconds, ISO string), replaced as a whole
+last_timestamp = (None, None)
+
+def current_timestamp():
+    """Return the current time in ISO format, reusing the last string within the same millisecond"""
+    global last_timestamp
+    now = time.time()
+    now_ms = int(now * 1000)
+    cached_ms, cached_str = last_timestamp
+    if now_ms == cached_ms:
+        return cached_str
+    timestamp = datetime.datetime.fromtimestamp(now).isoformat()
+    last_timestamp = (now_ms, timestamp)
+    return timestamp
+
 def generate_join_game_log():
     """Generate a log entry for the join-game module"""
-    user_id = random.choice(USERS)
-    map_name = random.choice(MAPS)
+    user_id = join_game_users.next()
+    map_name = join_game_maps.next()
     
     # RCU is typically high for join-game (60-66)
-    rcu = round(random.uniform(60.0, 66.0), 1)
+    rcu = join_game_rcus.next()
     # WCU is typically 7 for join-game
     wcu = 7.0
     
     # Latency between 95-145ms
-    latency_ms = round(random.uniform(95.0, 145.0), 8)
+    latency_ms = join_game_latencies.next()
     
     # Generate timestamp
-    timestamp = datetime.datetime.now().isoformat()
+    timestamp = current_timestamp()
     
     # Generate request ID
-    request_id = str(uuid.uuid4())
+    request_id = join_game_request_ids.next()
     
     # Create log entry
     log_entry = {
         "timestamp": timestamp,
         "module": "join-game",
-        "operations": [f"query_open_games_map_{map_name.replace(' ', '_')}", "join_game_transaction"],
+        "operations": JOIN_GAME_OPERATIONS[map_name],
         "user_id": user_id,
         "rcu": rcu,
         "wcu": wcu,
@@ -82,39 +199,39 @@ def generate_join_game_log():
         "latency_ms": latency_ms,
         "region": REGION,
         "request_id": request_id,
-        "table_usage": {"rcu": 0.0, "wcu": 4.0},
+        "table_usage": JOIN_GAME_TABLE_USAGE,
         "gsi_usage": {
             "OpenGamesIndex": {"rcu": rcu, "wcu": 1.0},
-            "InvertedIndex": {"rcu": 0, "wcu": 2.0}
+            "InvertedIndex": JOIN_GAME_INVERTED_INDEX_USAGE
         }
     }
     
-    stats["join_game_logs_generated"] += 1
+    get_thread_stats()[JOIN_GAME_LOGS_GENERATED] += 1
     return log_entry
 
 def generate_query_user_games_log():
     """Generate a log entry for the query-user-games module"""
-    user_id = random.choice(USERS)
+    user_id = query_user_users.next()
     
     # RCU is typically low for query-user-games (2-4)
-    rcu = round(random.uniform(2.0, 4.0), 1)
+    rcu = query_user_rcus.next()
     # WCU is typically 0 for query-user-games (read-only operation)
     wcu = 0
     
     # Latency between 55-70ms
-    latency_ms = round(random.uniform(55.0, 70.0), 8)
+    latency_ms = query_user_latencies.next()
     
     # Generate timestamp
-    timestamp = datetime.datetime.now().isoformat()
+    timestamp = current_timestamp()
     
     # Generate request ID
-    request_id = str(uuid.uuid4())
+    request_id = query_user_request_ids.next()
     
     # Create log entry
     log_entry = {
         "timestamp": timestamp,
         "module": "query-user-games",
-        "operations": [f"query_user_games_{user_id}", "get_game_details_batch_0"],
+        "operations": QUERY_USER_OPERATIONS[user_id],
         "user_id": user_id,
         "rcu": rcu,
         "wcu": wcu,
@@ -124,12 +241,10 @@ def generate_query_user_games_log():
         "region": REGION,
         "request_id": request_id,
         "table_usage": {"rcu": rcu - 0.5, "wcu": 0},
-        "gsi_usage": {
-            "InvertedIndex": {"rcu": 0.5, "wcu": 0}
-        }
+        "gsi_usage": QUERY_USER_GSI_USAGE
     }
     
-    stats["query_user_logs_generated"] += 1
+    get_thread_stats()[QUERY_USER_LOGS_GENERATED] += 1
     return log_entry
 
 def write_logs_to_file(logs):
@@ -138,23 +253,26 @@ def write_logs_to_file(logs):
         return True
     
     try:
-        # Write to NDJSON file (append mode)
-        with open(NDJSON_LOG_FILE, 'a') as f:
-            for log in logs:
-                f.write(json.dumps(log) + '\n')
+        # Join the batch into one payload and write it with a single call (binary append mode)
+        payload = b''.join([encode_log_line(log) for log in logs])
+        log_fh.write(payload)
+        log_fh.flush()
         
         logging.info(f"Successfully wrote {len(logs)} logs to NDJSON file")
-        stats["successful_writes"] += len(logs)
+        get_thread_stats()[SUCCESSFUL_WRITES] += len(logs)
         return True
         
     except Exception as e:
         logging.error(f"Error writing logs to file: {str(e)}")
-        stats["failed_writes"] += len(logs)
+        get_thread_stats()[FAILED_WRITES] += len(logs)
         return False
 
-def generate_and_write_logs(module_type):
-    """Generate logs for a specific module and write them to file"""
-    logs_buffer = []
+def generate_logs(module_type):
+    """Generate logs for a specific module and hand them to the writer thread"""
+    period = 1.0 / CALLS_PER_SECOND
+    # Deadline-based pacing: the next log is due one period after the previous one
+    # was due, so generation time does not make the rate drift
+    next_time = time.monotonic()
     
     while True:
         try:
@@ -164,35 +282,78 @@ def generate_and_write_logs(module_type):
             else:  # query-user-games
                 log = generate_query_user_games_log()
             
-            # Add log to buffer
-            logs_buffer.append(log)
-            
-            # If buffer reaches batch size, write to files
-            if len(logs_buffer) >= BATCH_SIZE:
-                write_logs_to_file(logs_buffer)
-                logs_buffer = []
+            log_queue.put(log)
             
-            # Sleep to maintain the desired rate
-            time.sleep(1.0 / CALLS_PER_SECOND)
+            # Sleep until the next log is due to maintain the desired rate
+            next_time += period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
             
         except Exception as e:
             logging.error(f"Error in {module_type} log generation: {str(e)}")
             time.sleep(1)  # Sleep and retry
+            next_time = time.monotonic()  # Don't burst to catch up after the pause
+
+def write_queued_logs():
+    """Collect logs from both generators and write them to file in batches,
+    until STOP_WRITER is received"""
+    stopping = False
+    while not stopping:
+        try:
+            # Block for the first log of a batch, then wait for more until the
+            # batch is full or its oldest log has waited MAX_BATCH_DELAY
+            log = log_queue.get()
+            if log is STOP_WRITER:
+                return
+            logs_buffer = [log]
+            deadline = time.monotonic() + MAX_BATCH_DELAY
+            while len(logs_buffer) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    log = log_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if log is STOP_WRITER:
+                    stopping = True
+                    break
+                logs_buffer.append(log)
+            
+            # Take any logs that queued up meanwhile without waiting, so at high
+            # generation rates each write call carries more logs instead of more calls
+            while not stopping and len(logs_buffer) < MAX_WRITE_BATCH:
+                try:
+                    log = log_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if log is STOP_WRITER:
+                    stopping = True
+                    break
+                logs_buffer.append(log)
+            
+            write_logs_to_file(logs_buffer)
+            
+        except Exception as e:
+            logging.error(f"Error in log writer: {str(e)}")
+            time.sleep(1)  # Sleep and retry
 
 def print_statistics():
     """Print statistics about the log generation and file writing process"""
     while True:
         time.sleep(30)  # Update stats every 30 seconds
         
-        runtime = time.time() - stats["start_time"]
+        runtime = time.time() - START_TIME
         hours, remainder = divmod(runtime, 3600)
         minutes, seconds = divmod(remainder, 60)
+        stats = snapshot_stats()
         
         logging.info("=== Statistics ===")
         logging.info(f"Runtime: {int(hours)}h {int(minutes)}m {int(seconds)}s")
         logging.info(f"Join-game logs generated: {stats['join_game_logs_generated']}")
         logging.info(f"Query-user logs generated: {stats['query_user_logs_generated']}")
-        logging.info(f"Total logs generated: {stats['join_game_logs_generated'] + stats['query_user_logs_generated']}")
+        logging.info(f"Total logs generated: {stats['total_logs_generated']}")
         logging.info(f"Successful writes: {stats['successful_writes']}")
         logging.info(f"Failed writes: {stats['failed_writes']}")
         
@@ -202,7 +363,7 @@ def print_statistics():
             logging.info(f"NDJSON log file size: {ndjson_size:.2f} MB")
         
         if runtime > 0:
-            rate = (stats['join_game_logs_generated'] + stats['query_user_logs_generated']) / runtime
+            rate = stats['total_logs_generated'] / runtime
             logging.info(f"Generation rate: {rate:.2f} logs/second")
 
 def main():
@@ -217,19 +378,28 @@ def main():
         open(NDJSON_LOG_FILE, 'w').close()
         logging.info(f"Created empty NDJSON log file: {NDJSON_LOG_FILE}")
     
+    # Keep the NDJSON log file open for the lifetime of the generator
+    open_log_file()
+    
     # Start threads for each module type
     join_game_thread = threading.Thread(
-        target=generate_and_write_logs,
+        target=generate_logs,
         args=("join-game",),
         daemon=True
     )
     
     query_user_games_thread = threading.Thread(
-        target=generate_and_write_logs,
+        target=generate_logs,
         args=("query-user-games",),
         daemon=True
     )
     
+    # Single writer thread owns the NDJSON log file
+    writer_thread = threading.Thread(
+        target=write_queued_logs,
+        daemon=True
+    )
+    
     # Start statistics thread
     stats_thread = threading.Thread(
         target=print_statistics,
@@ -238,6 +408,7 @@ def main():
     
     join_game_thread.start()
     query_user_games_thread.start()
+    writer_thread.start()
     stats_thread.start()
     
     logging.info("Log generation threads started")
@@ -249,16 +420,22 @@ def main():
         while True:
             time.sleep(10)
     except KeyboardInterrupt:
+        # Let the writer thread write the logs queued so far before the file is closed
+        log_queue.put(STOP_WRITER)
+        writer_thread.join()
+        log_fh.close()
+        
         # Calculate final statistics
-        runtime = time.time() - stats["start_time"]
+        runtime = time.time() - START_TIME
         hours, remainder = divmod(runtime, 3600)
         minutes, seconds = divmod(remainder, 60)
+        stats = snapshot_stats()
         
         logging.info("\n=== Final Statistics ===")
         logging.info(f"Total runtime: {int(hours)}h {int(minutes)}m {int(seconds)}s")
         logging.info(f"Join-game logs generated: {stats['join_game_logs_generated']}")
         logging.info(f"Query-user logs generated: {stats['query_user_logs_generated']}")
-        logging.info(f"Total logs generated: {stats['join_game_logs_generated'] + stats['query_user_logs_generated']}")
+        logging.info(f"Total logs generated: {stats['total_logs_generated']}")
         logging.info(f"Successful writes: {stats['successful_writes']}")
         logging.info(f"Failed writes: {stats['failed_writes']}")
         
@@ -268,7 +445,7 @@ def main():
             logging.info(f"Final NDJSON log file size: {ndjson_size:.2f} MB")
         
         if runtime > 0:
-            rate = (stats['join_game_logs_generated'] + stats['query_user_logs_generated']) / runtime
+            rate = stats['total_logs_generated'] / runtime
             logging.info(f"Average generation rate: {rate:.2f} logs/second")
         
         logging.info("Log generation stopped")
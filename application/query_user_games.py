@@ -1,3 +1,4 @@
+import atexit
 import boto3
 import random
 import time
@@ -5,31 +6,56 @@ import uuid
 import json
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from botocore.exceptions import ClientError
 
+# Use orjson for log serialization when it is installed
+try:
+    import orjson
+    
+    def encode_log_line(obj):
+        """Encode a log entry as one UTF-8 JSON line, including the trailing newline."""
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    def encode_log_line(obj):
+        """Encode a log entry as one UTF-8 JSON line, including the trailing newline."""
+        return (json.dumps(obj) + '\n').encode()
+
 # Configure logging
 # Console logger for application logs
 console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
 
-# File logger for JSON logs - only for DynamoDB resource usage
-file_handler = logging.FileHandler("dynamodb_resource_usage.log")
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))  # Include timestamp in log file
-
 # Create separate loggers
 app_logger = logging.getLogger('app')
 app_logger.setLevel(logging.INFO)
 app_logger.addHandler(console_handler)
 app_logger.propagate = False
 
-# DynamoDB resource usage logger
-ddb_logger = logging.getLogger('ddb_resources')
-ddb_logger.setLevel(logging.INFO)
-ddb_logger.addHandler(file_handler)
-ddb_logger.propagate = False
+# DynamoDB resource usage log file. Entries are appended directly instead of going
+# through logging, in the same "asctime - JSON" line format as the other modules.
+# The file is opened on first use and flushed when the buffer fills or at exit.
+DDB_LOG_FILE = "dynamodb_resource_usage.log"
+DDB_LOG_BUFFER_SIZE = 64 * 1024
+ddb_log_file = None
+
+def write_ddb_log_line(log_entry):
+    """
+    Append one resource usage entry to the DynamoDB resource log file.
+    
+    Parameters:
+    - log_entry: The log entry to encode as JSON
+    """
+    global ddb_log_file
+    if ddb_log_file is None:
+        ddb_log_file = open(DDB_LOG_FILE, 'ab', buffering=DDB_LOG_BUFFER_SIZE)
+        atexit.register(ddb_log_file.close)
+    # Same timestamp layout as logging's default asctime
+    now = time.time()
+    asctime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)) + ',%03d' % (now % 1 * 1000)
+    ddb_log_file.write(asctime.encode() + b' - ' + encode_log_line(log_entry))
 
 # For backward compatibility
 logger = app_logger
@@ -40,6 +66,17 @@ dynamodb = boto3.client('dynamodb')
 # Constants
 TABLE_NAME = "battle-royale"
 MODULE_NAME = "query-user-games"
+BATCH_GET_MAX_KEYS = 100  # DynamoDB BatchGetItem limit
+BATCH_GET_WORKERS = 8  # Maximum concurrent BatchGetItem requests
+USER_CACHE_TTL = 300  # Seconds the sampled user IDs are reused before scanning again
+
+# Game detail fields decoded from BatchGetItem items as (attribute name, DynamoDB type, cast)
+GAME_DETAIL_FIELDS = (
+    ('map', 'S', str),
+    ('people', 'N', int),
+    ('max_people', 'N', int),
+    ('open_timestamp', 'N', int)
+)
 
 class ResourceTracker:
     """
@@ -59,13 +96,15 @@ class ResourceTracker:
         self.status = "success"
         self.error = None
     
-    def add_consumption(self, operation, consumed_capacity):
+    def add_consumption(self, operation, consumed_capacity, is_read=True):
         """
         Add resource consumption from an operation to the total.
         
         Parameters:
         - operation: The operation name
         - consumed_capacity: The consumed capacity information from DynamoDB
+        - is_read: Whether the operation consumes read capacity (the caller knows
+          the operation type, so it is not derived from the operation name)
         """
         # Handle case where consumed_capacity might be None
         if consumed_capacity is None:
@@ -74,122 +113,83 @@ class ResourceTracker:
         
         if isinstance(consumed_capacity, dict):
             # For single operations
-            # Get base table consumption directly from DynamoDB response
-            table_rcu = consumed_capacity.get('Table', {}).get('ReadCapacityUnits', 0)
-            table_wcu = consumed_capacity.get('Table', {}).get('WriteCapacityUnits', 0)
+            self._accumulate_item(consumed_capacity, is_read)
+        elif isinstance(consumed_capacity, list):
+            # For batch and transactional operations
+            for item in consumed_capacity:
+                if isinstance(item, dict):  # Ensure item is a dictionary
+                    self._accumulate_item(item, is_read)
+        
+        self.operations.append(operation)
+    
+    def _accumulate_item(self, item, is_read):
+        """
+        Add one ConsumedCapacity entry to the table, GSI and total consumption.
+        
+        Parameters:
+        - item: A single ConsumedCapacity entry from DynamoDB
+        - is_read: Whether the operation consumes read capacity
+        """
+        get = item.get
+        
+        # Get base table consumption directly from DynamoDB response
+        table = get('Table')
+        if table:
+            table_rcu = table.get('ReadCapacityUnits', 0)
+            table_wcu = table.get('WriteCapacityUnits', 0)
             
             # If Table doesn't have separate RCU/WCU, check for CapacityUnits
-            if table_rcu == 0 and table_wcu == 0 and 'Table' in consumed_capacity:
-                table_capacity = consumed_capacity['Table'].get('CapacityUnits', 0)
-                if operation.startswith('get_') or operation.startswith('query_'):
+            if table_rcu == 0 and table_wcu == 0:
+                table_capacity = table.get('CapacityUnits', 0)
+                if is_read:
                     table_rcu = table_capacity
                 else:
                     table_wcu = table_capacity
-            
-            # Update table consumption
-            self.table_consumption['rcu'] += table_rcu
-            self.table_consumption['wcu'] += table_wcu
-            
-            # Track GSI consumption if available
-            gsi_rcu_total = 0
-            gsi_wcu_total = 0
-            if 'GlobalSecondaryIndexes' in consumed_capacity:
-                for gsi_name, gsi_data in consumed_capacity['GlobalSecondaryIndexes'].items():
-                    gsi_rcu = gsi_data.get('ReadCapacityUnits', 0)
-                    gsi_wcu = gsi_data.get('WriteCapacityUnits', 0)
-                    
-                    # If GSI doesn't have separate RCU/WCU, check for CapacityUnits
-                    if gsi_rcu == 0 and gsi_wcu == 0:
-                        gsi_capacity = gsi_data.get('CapacityUnits', 0)
-                        if operation.startswith('get_') or operation.startswith('query_'):
-                            gsi_rcu = gsi_capacity
-                        else:
-                            gsi_wcu = gsi_capacity
-                    
-                    if gsi_name not in self.gsi_consumption:
-                        self.gsi_consumption[gsi_name] = {'rcu': 0, 'wcu': 0}
-                    
-                    self.gsi_consumption[gsi_name]['rcu'] += gsi_rcu
-                    self.gsi_consumption[gsi_name]['wcu'] += gsi_wcu
-                    
-                    gsi_rcu_total += gsi_rcu
-                    gsi_wcu_total += gsi_wcu
-            
-            # Add to total consumption - directly from DynamoDB's total or sum of components
-            if 'CapacityUnits' in consumed_capacity:
-                # If DynamoDB provides a total, use it
-                capacity_units = consumed_capacity.get('CapacityUnits', 0)
-                if operation.startswith('get_') or operation.startswith('query_'):
-                    self.total_rcu += capacity_units
-                else:
-                    self.total_wcu += capacity_units
-            else:
-                # Otherwise sum the components
-                self.total_rcu += table_rcu + gsi_rcu_total
-                self.total_wcu += table_wcu + gsi_wcu_total
+        else:
+            table_rcu = table_wcu = 0
         
-        elif isinstance(consumed_capacity, list):
-            # For transactional operations
-            for item in consumed_capacity:
-                if isinstance(item, dict):  # Ensure item is a dictionary
-                    # Get base table consumption directly from DynamoDB response
-                    table_rcu = item.get('Table', {}).get('ReadCapacityUnits', 0)
-                    table_wcu = item.get('Table', {}).get('WriteCapacityUnits', 0)
-                    
-                    # If Table doesn't have separate RCU/WCU, check for CapacityUnits
-                    if table_rcu == 0 and table_wcu == 0 and 'Table' in item:
-                        table_capacity = item['Table'].get('CapacityUnits', 0)
-                        if operation.startswith('get_') or operation.startswith('query_'):
-                            table_rcu = table_capacity
-                        else:
-                            table_wcu = table_capacity
-                    
-                    # Update table consumption
-                    self.table_consumption['rcu'] += table_rcu
-                    self.table_consumption['wcu'] += table_wcu
-                    
-                    # Track GSI consumption for transactional operations
-                    gsi_item_rcu_total = 0
-                    gsi_item_wcu_total = 0
-                    if 'GlobalSecondaryIndexes' in item:
-                        for gsi_name, gsi_data in item['GlobalSecondaryIndexes'].items():
-                            gsi_rcu = gsi_data.get('ReadCapacityUnits', 0)
-                            gsi_wcu = gsi_data.get('WriteCapacityUnits', 0)
-                            
-                            # If GSI doesn't have separate RCU/WCU, check for CapacityUnits
-                            if gsi_rcu == 0 and gsi_wcu == 0:
-                                gsi_capacity = gsi_data.get('CapacityUnits', 0)
-                                if operation.startswith('get_') or operation.startswith('query_'):
-                                    gsi_rcu = gsi_capacity
-                                else:
-                                    gsi_wcu = gsi_capacity
-                            
-                            if gsi_name not in self.gsi_consumption:
-                                self.gsi_consumption[gsi_name] = {'rcu': 0, 'wcu': 0}
-                            
-                            self.gsi_consumption[gsi_name]['rcu'] += gsi_rcu
-                            self.gsi_consumption[gsi_name]['wcu'] += gsi_wcu
-                            
-                            gsi_item_rcu_total += gsi_rcu
-                            gsi_item_wcu_total += gsi_wcu
-                    
-                    # Add to total consumption
-                    if 'CapacityUnits' in item:
-                        # If DynamoDB provides a total, use it
-                        capacity_units = item.get('CapacityUnits', 0)
-                        if operation.startswith('get_') or operation.startswith('query_'):
-                            self.total_rcu += capacity_units
-                        else:
-                            self.total_wcu += capacity_units
+        # Update table consumption
+        self.table_consumption['rcu'] += table_rcu
+        self.table_consumption['wcu'] += table_wcu
+        
+        # Track GSI consumption if available
+        gsi_rcu_total = 0
+        gsi_wcu_total = 0
+        gsis = get('GlobalSecondaryIndexes')
+        if gsis:
+            for gsi_name, gsi_data in gsis.items():
+                gsi_rcu = gsi_data.get('ReadCapacityUnits', 0)
+                gsi_wcu = gsi_data.get('WriteCapacityUnits', 0)
+                
+                # If GSI doesn't have separate RCU/WCU, check for CapacityUnits
+                if gsi_rcu == 0 and gsi_wcu == 0:
+                    gsi_capacity = gsi_data.get('CapacityUnits', 0)
+                    if is_read:
+                        gsi_rcu = gsi_capacity
                     else:
-                        # For this item, add the components to the total
-                        item_rcu = table_rcu + gsi_item_rcu_total
-                        item_wcu = table_wcu + gsi_item_wcu_total
-                        
-                        self.total_rcu += item_rcu
-                        self.total_wcu += item_wcu
+                        gsi_wcu = gsi_capacity
+                
+                if gsi_name not in self.gsi_consumption:
+                    self.gsi_consumption[gsi_name] = {'rcu': 0, 'wcu': 0}
+                
+                self.gsi_consumption[gsi_name]['rcu'] += gsi_rcu
+                self.gsi_consumption[gsi_name]['wcu'] += gsi_wcu
+                
+                gsi_rcu_total += gsi_rcu
+                gsi_wcu_total += gsi_wcu
         
-        self.operations.append(operation)
+        # Add to total consumption - directly from DynamoDB's total or sum of components
+        capacity_units = get('CapacityUnits')
+        if capacity_units is not None:
+            # If DynamoDB provides a total, use it
+            if is_read:
+                self.total_rcu += capacity_units
+            else:
+                self.total_wcu += capacity_units
+        else:
+            # Otherwise sum the components
+            self.total_rcu += table_rcu + gsi_rcu_total
+            self.total_wcu += table_wcu + gsi_wcu_total
     
     def set_error(self, error_msg):
         """Set error status and message."""
@@ -203,11 +203,23 @@ class ResourceTracker:
 # Create global resource tracker
 resource_tracker = ResourceTracker()
 
+# User IDs sampled from the table as (monotonic fetch time, user IDs), replaced as a whole
+_user_cache = (0.0, ())
+
 def get_random_user_from_table():
     """
     Query users from the DynamoDB table and return a random user ID.
+    The sampled users are cached for USER_CACHE_TTL seconds, so the scan is
+    not repeated on every call.
     This function does not track DynamoDB resource consumption.
     """
+    global _user_cache
+    fetched_at, user_ids = _user_cache
+    if user_ids and time.monotonic() - fetched_at < USER_CACHE_TTL:
+        user_id = random.choice(user_ids)
+        logger.info(f"Selected random user from cache: {user_id}")
+        return user_id
+    
     try:
         # Query users from the table
         response = dynamodb.scan(
@@ -227,9 +239,12 @@ def get_random_user_from_table():
             logger.warning("No users found in the table, generating a random user ID instead")
             return f"user_{uuid.uuid4().hex[:8]}"
         
+        # Cache the sampled users for later calls
+        user_ids = tuple(item['PK']['S'].replace('USER#', '') for item in users)
+        _user_cache = (time.monotonic(), user_ids)
+        
         # Select a random user
-        selected_user = random.choice(users)
-        user_id = selected_user['PK']['S'].replace('USER#', '')
+        user_id = random.choice(user_ids)
         
         logger.info(f"Selected random user: {user_id}")
         return user_id
@@ -265,7 +280,7 @@ def query_user_games(user_id):
         # Add consumed capacity to tracker
         if 'ConsumedCapacity' in response:
             consumed_capacity = response['ConsumedCapacity']
-            resource_tracker.add_consumption(f"query_user_games_{user_id}", consumed_capacity)
+            resource_tracker.add_consumption(f"query_user_games_{user_id}", consumed_capacity, is_read=True)
         else:
             # Just record that the operation happened
             resource_tracker.operations.append(f"query_user_games_{user_id}")
@@ -309,6 +324,26 @@ def query_user_games(user_id):
         logger.error(f"Error querying games using InvertedIndex GSI: {str(e)}")
         return []
 
+def fetch_game_batch(batch_keys):
+    """
+    Fetch one batch of game metadata items with BatchGetItem.
+    
+    Parameters:
+    - batch_keys: Up to BATCH_GET_MAX_KEYS primary keys to fetch
+    
+    Returns:
+    - The batch_get_item response
+    """
+    return dynamodb.batch_get_item(
+        RequestItems={
+            TABLE_NAME: {
+                'Keys': batch_keys,
+                'ConsistentRead': False
+            }
+        },
+        ReturnConsumedCapacity="INDEXES"
+    )
+
 def get_game_details(game_ids):
     """
     Get detailed information about games using their IDs.
@@ -334,27 +369,25 @@ def get_game_details(game_ids):
             })
         
         # Split into batches of 100 if needed (DynamoDB BatchGetItem limit)
+        batches = [keys[i:i + BATCH_GET_MAX_KEYS] for i in range(0, len(keys), BATCH_GET_MAX_KEYS)]
+        
+        # Issue the batches concurrently; responses are returned in batch order and
+        # merged below on this thread, so the tracker needs no locking
+        if len(batches) == 1:
+            responses = [fetch_game_batch(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(BATCH_GET_WORKERS, len(batches))) as executor:
+                responses = list(executor.map(fetch_game_batch, batches))
+        
         all_game_details = []
-        for i in range(0, len(keys), 100):
-            batch_keys = keys[i:i+100]
-            
-            response = dynamodb.batch_get_item(
-                RequestItems={
-                    TABLE_NAME: {
-                        'Keys': batch_keys,
-                        'ConsistentRead': False
-                    }
-                },
-                ReturnConsumedCapacity="INDEXES"
-            )
-            
+        for batch_index, response in enumerate(responses):
             # Add consumed capacity to tracker
             if 'ConsumedCapacity' in response:
                 consumed_capacity = response['ConsumedCapacity']
-                resource_tracker.add_consumption(f"get_game_details_batch_{i//100}", consumed_capacity)
+                resource_tracker.add_consumption(f"get_game_details_batch_{batch_index}", consumed_capacity, is_read=True)
             else:
                 # Just record that the operation happened
-                resource_tracker.operations.append(f"get_game_details_batch_{i//100}")
+                resource_tracker.operations.append(f"get_game_details_batch_{batch_index}")
             
             # Extract game details
             if 'Responses' in response and TABLE_NAME in response['Responses']:
@@ -364,25 +397,19 @@ def get_game_details(game_ids):
                     game_detail = {}
                     
                     # Extract game ID
-                    if 'game_id' in item and 'S' in item['game_id']:
-                        game_detail['game_id'] = item['game_id']['S']
-                    elif 'PK' in item and 'S' in item['PK']:
-                        pk = item['PK']['S']
-                        if pk.startswith('GAME#'):
+                    game_id = item.get('game_id', {}).get('S')
+                    if game_id is not None:
+                        game_detail['game_id'] = game_id
+                    else:
+                        pk = item.get('PK', {}).get('S')
+                        if pk is not None and pk.startswith('GAME#'):
                             game_detail['game_id'] = pk[5:]  # Remove 'GAME#' prefix
                     
                     # Extract other game details
-                    if 'map' in item and 'S' in item['map']:
-                        game_detail['map'] = item['map']['S']
-                    
-                    if 'people' in item and 'N' in item['people']:
-                        game_detail['people'] = int(item['people']['N'])
-                    
-                    if 'max_people' in item and 'N' in item['max_people']:
-                        game_detail['max_people'] = int(item['max_people']['N'])
-                    
-                    if 'open_timestamp' in item and 'N' in item['open_timestamp']:
-                        game_detail['open_timestamp'] = int(item['open_timestamp']['N'])
+                    for name, dtype, cast in GAME_DETAIL_FIELDS:
+                        value = item.get(name)
+                        if value is not None and dtype in value:
+                            game_detail[name] = cast(value[dtype])
                     
                     all_game_details.append(game_detail)
         
@@ -415,7 +442,7 @@ def log_resource_usage(user_id):
         "status": resource_tracker.status,
         "latency_ms": resource_tracker.get_latency_ms(),
         "region": boto3.session.Session().region_name,
-        "request_id": str(uuid.uuid4())
+        "request_id": uuid.uuid4().hex
     }
     
     # Add base table consumption information
@@ -429,8 +456,8 @@ def log_resource_usage(user_id):
     if resource_tracker.error:
         log_entry["error"] = resource_tracker.error
     
-    # Log only to the DynamoDB resource logger - not to console
-    ddb_logger.info(json.dumps(log_entry))
+    # Append only to the DynamoDB resource log file - not to console
+    write_ddb_log_line(log_entry)
 
 def main():
     """
@@ -1,10 +1,18 @@
+import time
+
 import boto3
 
 dynamodb = boto3.client('dynamodb')
 
+TABLE_NAME = 'battle-royale'
+# Pre-warmed write throughput, so the bulk load does not start at the
+# throughput a new on-demand table begins with
+WARM_WRITE_UNITS_PER_SECOND = 40000
+POLL_INTERVAL = 5  # Seconds between table status checks
+
 try:
     dynamodb.create_table(
-        TableName='battle-royale',
+        TableName=TABLE_NAME,
         AttributeDefinitions=[
             {
                 "AttributeName": "PK",
@@ -27,7 +35,32 @@ try:
         ],
         BillingMode='PAY_PER_REQUEST'
     )
+    print("Waiting for the table to become ACTIVE...")
+    dynamodb.get_waiter('table_exists').wait(TableName=TABLE_NAME)
     print("Table created successfully with On-Demand capacity mode.")
 except Exception as e:
     print("Could not create table. Error:")
     print(e)
+else:
+    # Pre-warming is a separate, optional step: older botocore versions reject the
+    # WarmThroughput parameter, which must not prevent the table from being created
+    try:
+        dynamodb.update_table(
+            TableName=TABLE_NAME,
+            WarmThroughput={
+                "WriteUnitsPerSecond": WARM_WRITE_UNITS_PER_SECOND
+            }
+        )
+        # The table is UPDATING until the warm throughput is applied, and setup_indexes.py
+        # cannot add indexes until then, so wait for both to become ACTIVE
+        print(f"Waiting for warm throughput of {WARM_WRITE_UNITS_PER_SECOND} write units per second...")
+        while True:
+            table = dynamodb.describe_table(TableName=TABLE_NAME)['Table']
+            warm_status = table.get('WarmThroughput', {}).get('Status')
+            if table['TableStatus'] == 'ACTIVE' and warm_status == 'ACTIVE':
+                break
+            time.sleep(POLL_INTERVAL)
+        print("Table pre-warmed successfully.")
+    except Exception as e:
+        print("Could not pre-warm the table; it keeps the default on-demand throughput. Error:")
+        print(e)
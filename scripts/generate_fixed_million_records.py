@@ -1,123 +1,183 @@
-import json
+import os
 import boto3
 import random
-import uuid
 import time
 import argparse
+import queue
+from collections import deque
 from datetime import datetime, timedelta
 from faker import Faker
-import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
-import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 # Initialize Faker to generate realistic data
 fake = Faker()
 
-# Initialize DynamoDB resource
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table('battle-royale')
+# Initialize DynamoDB client shared by all writer threads.
+# The connection pool is sized above the default thread count so threads do not
+# discard and reopen connections, and adaptive retries back off on throttling.
+# Throttled batches are mostly retried by write_requests, so botocore only gets
+# a few attempts of its own instead of multiplying the two retry budgets.
+DYNAMODB_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=64,
+    retries={'max_attempts': 3, 'mode': 'adaptive'}
+)
+client = boto3.client('dynamodb', config=DYNAMODB_CONFIG)
 
 # Constants
+TABLE_NAME = 'battle-royale'
 TOTAL_RECORDS = 1000000  # 固定为100万条记录
-BATCH_SIZE = 25  # DynamoDB allows max 25 items per batch write
+MAX_BATCH_WRITE_ITEMS = 25  # DynamoDB allows max 25 items per batch write
+BATCH_SIZE = MAX_BATCH_WRITE_ITEMS  # Records per batch write
 CHUNK_SIZE = 1000  # Process 1000 records at a time
+WRITE_QUEUE_SIZE = 200  # Batches waiting for a writer thread before generation pauses
 DEFAULT_NUM_THREADS = 20  # Default number of threads to use
+DEFAULT_NUM_PROCESSES = os.cpu_count() or 1  # Default number of record generator processes
+MAX_WRITE_RETRIES = 10  # Retries of unprocessed or throttled items before a batch gives up
+RETRY_BASE_DELAY = 0.05  # First backoff delay in seconds, doubled on every retry
+RETRY_MAX_DELAY = 2.0  # Upper bound of a single backoff delay in seconds
+MIN_SPLIT_ITEMS = 5  # Smallest part a throttled batch is split into; smaller parts just back off
+THROTTLING_ERROR_CODES = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+FAKE_POOL_SIZE = 5000  # Number of pre-generated values of each fake field
+GAME_TIME_FORMAT = "%Y-%m-%d-%H:%M:%S"  # Format of the game create/start/end times
 
-# Global counter with lock for thread safety
-successful_records = 0
-records_lock = threading.Lock()
+# Record types generated by generate_records, with cumulative probabilities:
+# 60% user records, 10% game metadata and 30% game-player relationships
+USER_RECORD, GAME_RECORD, GAME_PLAYER_RECORD = range(3)
+RECORD_TYPES = (USER_RECORD, GAME_RECORD, GAME_PLAYER_RECORD)
+RECORD_TYPE_CUM_WEIGHTS = (0.6, 0.7, 1.0)
+
+# 50 different map names for games
+MAPS = (
+    "Green Grasslands", "Dirty Desert", "Urban Underground", "Juicy Jungle", "Open Ocean",
+    "Mystic Mountains", "Frozen Frontier", "Volcanic Valley", "Haunted Hills", "Sunny Shores",
+    "Cosmic Crater", "Ancient Ruins", "Neon City", "Foggy Forest", "Crystal Caves",
+    "Burning Badlands", "Stormy Skies", "Toxic Tundra", "Peaceful Peaks", "Deadly Dunes",
+    "Lava Lakes", "Windy Wasteland", "Tropical Treetops", "Icy Islands", "Murky Marshes",
+    "Savage Savannah", "Radiant Reef", "Dusty Docks", "Phantom Fortress", "Bamboo Basin",
+    "Crimson Canyon", "Emerald Estuary", "Golden Gorge", "Hidden Harbor", "Ivory Isle",
+    "Jade Jungle", "Karst Kingdom", "Lunar Landscape", "Midnight Meadow", "Nebula Nexus",
+    "Obsidian Outpost", "Prismatic Plains", "Quantum Quarry", "Ruby Ridge", "Sapphire Springs",
+    "Twilight Temple", "Umbra Uplands", "Verdant Valley", "Whispering Woods", "Xenon Xanadu"
+)
+
+# Fake values generated once and sampled per record, since each Faker call is
+# far slower than a random pick. Usernames get a random suffix per record.
+USERNAMES = [fake.user_name() for _ in range(FAKE_POOL_SIZE)]
+ADDRESSES = [fake.address().replace('\n', ' ') for _ in range(FAKE_POOL_SIZE)]
+BIRTHDATES = [fake.date_of_birth(minimum_age=18, maximum_age=90).strftime("%Y-%m-%d") for _ in range(FAKE_POOL_SIZE)]
+EMAILS = [fake.email() for _ in range(FAKE_POOL_SIZE)]
+NAMES = [fake.name() for _ in range(FAKE_POOL_SIZE)]
+# Usernames are user keys, so the suffix range (1 to 2^30, about 10^9) is wide
+# enough that about 600k generated users almost never collide. The range is too
+# large for a pre-formatted pool; getrandbits is the cheapest way to draw from it.
+USERNAME_SUFFIX_BITS = 30
+
+# Key prefixes of the battle-royale single-table design
+USER_PREFIX = "USER#"
+GAME_PREFIX = "GAME#"
+METADATA_PREFIX = "#METADATA#"
+
+# Random generator used by the record generators. Each generator process
+# reseeds its own copy from os.urandom in _init_worker.
+rng = random.Random(os.urandom(16))
+
+def _init_worker():
+    """Give each generator process its own random state.
+    Forked workers would otherwise all start from the parent's state and
+    generate the same sequence of values.
+    """
+    rng.seed(os.urandom(16))
+
+def new_game_ids(n):
+    """Generate n random 32-character hex game IDs from a single os.urandom() call"""
+    data = os.urandom(16 * n).hex()
+    return [data[i:i + 32] for i in range(0, 32 * n, 32)]
+
+def random_username():
+    """Return a random pooled username with a random numeric suffix"""
+    return rng.choice(USERNAMES) + str(rng.getrandbits(USERNAME_SUFFIX_BITS) + 1)
 
 def generate_user_record():
-    """Generate a random user record similar to the existing data"""
-    username = f"{fake.user_name()}{random.randint(1, 999)}"
+    """Generate a random user record similar to the existing data, as DynamoDB attribute values"""
+    username = random_username()
     
     user = {
-        "PK": f"USER#{username}",
-        "SK": f"#METADATA#{username}",
-        "address": fake.address().replace('\n', ' '),
-        "birthdate": fake.date_of_birth(minimum_age=18, maximum_age=90).strftime("%Y-%m-%d"),
-        "email": fake.email(),
-        "name": fake.name(),
-        "username": username
+        "PK": {"S": USER_PREFIX + username},
+        "SK": {"S": METADATA_PREFIX + username},
+        "address": {"S": rng.choice(ADDRESSES)},
+        "birthdate": {"S": rng.choice(BIRTHDATES)},
+        "email": {"S": rng.choice(EMAILS)},
+        "name": {"S": rng.choice(NAMES)},
+        "username": {"S": username}
     }
     
     return user
 
-def generate_game_record():
+def generate_game_record(game_id, map_name):
     """Generate a random game record according to the specified rules:
     - 1% are open games with people=0 and open_timestamp
     - 99% are started games with people=500
     - 30% of started games are completed
+    The record is built directly as DynamoDB attribute values.
     """
-    game_id = str(uuid.uuid4())
-    creator = f"{fake.user_name()}{random.randint(1, 999)}"
-    create_time = (datetime.now() - timedelta(days=random.randint(0, 365))).strftime("%Y-%m-%d-%H:%M:%S")
-    
-    # 50 different map names for games
-    maps = [
-        "Green Grasslands", "Dirty Desert", "Urban Underground", "Juicy Jungle", "Open Ocean",
-        "Mystic Mountains", "Frozen Frontier", "Volcanic Valley", "Haunted Hills", "Sunny Shores",
-        "Cosmic Crater", "Ancient Ruins", "Neon City", "Foggy Forest", "Crystal Caves",
-        "Burning Badlands", "Stormy Skies", "Toxic Tundra", "Peaceful Peaks", "Deadly Dunes",
-        "Lava Lakes", "Windy Wasteland", "Tropical Treetops", "Icy Islands", "Murky Marshes",
-        "Savage Savannah", "Radiant Reef", "Dusty Docks", "Phantom Fortress", "Bamboo Basin",
-        "Crimson Canyon", "Emerald Estuary", "Golden Gorge", "Hidden Harbor", "Ivory Isle",
-        "Jade Jungle", "Karst Kingdom", "Lunar Landscape", "Midnight Meadow", "Nebula Nexus",
-        "Obsidian Outpost", "Prismatic Plains", "Quantum Quarry", "Ruby Ridge", "Sapphire Springs",
-        "Twilight Temple", "Umbra Uplands", "Verdant Valley", "Whispering Woods", "Xenon Xanadu"
-    ]
+    creator = random_username()
+    create_dt = datetime.now() - timedelta(days=rng.randint(0, 365))
+    create_time = create_dt.strftime(GAME_TIME_FORMAT)
     
     # 基本游戏记录，所有游戏都有这些字段
     game = {
-        "PK": f"GAME#{game_id}",
-        "SK": f"#METADATA#{game_id}",
-        "game_id": game_id,
-        "map": random.choice(maps),  # 所有游戏都有map字段
-        "create_time": create_time,
-        "creator": creator
+        "PK": {"S": GAME_PREFIX + game_id},
+        "SK": {"S": METADATA_PREFIX + game_id},
+        "game_id": {"S": game_id},
+        "map": {"S": map_name},  # 所有游戏都有map字段
+        "create_time": {"S": create_time},
+        "creator": {"S": creator}
     }
     
     # Determine if this is an open game (1% chance)
-    is_open_game = random.random() < 0.01
+    is_open_game = rng.random() < 0.01
     
     if is_open_game:
         # Open games have people=0 and open_timestamp
-        game["people"] = 0
-        game["open_timestamp"] = create_time
+        game["people"] = {"N": "0"}
+        game["open_timestamp"] = {"S": create_time}
     else:
         # All started games have people=500 and start_time
-        game["people"] = 500
-        game["start_time"] = (datetime.strptime(create_time, "%Y-%m-%d-%H:%M:%S") + 
-                             timedelta(minutes=random.randint(5, 15))).strftime("%Y-%m-%d-%H:%M:%S")
+        game["people"] = {"N": "500"}
+        start_dt = create_dt + timedelta(minutes=rng.randint(5, 15))
+        game["start_time"] = {"S": start_dt.strftime(GAME_TIME_FORMAT)}
         
         # 30% of started games are completed
-        if random.random() < 0.3:
-            game["end_time"] = (datetime.strptime(game["start_time"], "%Y-%m-%d-%H:%M:%S") + 
-                               timedelta(minutes=random.randint(10, 30))).strftime("%Y-%m-%d-%H:%M:%S")
+        if rng.random() < 0.3:
+            end_dt = start_dt + timedelta(minutes=rng.randint(10, 30))
+            game["end_time"] = {"S": end_dt.strftime(GAME_TIME_FORMAT)}
             
             # Add winners for completed games
-            players = [f"{fake.user_name()}{random.randint(1, 999)}" for _ in range(3)]
-            game["gold"] = players[0]
-            game["silver"] = players[1]
-            game["bronze"] = players[2]
+            players = [random_username() for _ in range(3)]
+            game["gold"] = {"S": players[0]}
+            game["silver"] = {"S": players[1]}
+            game["bronze"] = {"S": players[2]}
     
     return game
 
 def generate_game_player_record(game_id):
-    """Generate a game-player relationship record"""
-    username = f"{fake.user_name()}{random.randint(1, 999)}"
+    """Generate a game-player relationship record, as DynamoDB attribute values"""
+    username = random_username()
     
     record = {
-        "PK": f"GAME#{game_id}",
-        "SK": f"USER#{username}",
-        "username": username,
-        "game_id": game_id
+        "PK": {"S": GAME_PREFIX + game_id},
+        "SK": {"S": USER_PREFIX + username},
+        "username": {"S": username},
+        "game_id": {"S": game_id}
     }
     
     # Add place for winners (small chance)
-    if random.random() < 0.06:  # ~6% chance to be a winner
+    if rng.random() < 0.06:  # ~6% chance to be a winner
         places = ["gold", "silver", "bronze"]
-        record["place"] = random.choice(places)
+        record["place"] = {"S": rng.choice(places)}
     
     return record
 
@@ -125,130 +185,191 @@ def generate_records(num_records):
     """Generate a mix of user, game, and game-player records"""
     records = []
     
-    for _ in range(num_records):
-        record_type = random.random()
-        
-        if record_type < 0.6:  # 60% chance for user records
+    # Record types, game IDs and game maps for the whole chunk, drawn at once
+    record_types = rng.choices(RECORD_TYPES, cum_weights=RECORD_TYPE_CUM_WEIGHTS, k=num_records)
+    num_games = record_types.count(GAME_RECORD)
+    game_ids = new_game_ids(max(num_games, 1))
+    new_games = zip(game_ids, rng.choices(MAPS, k=num_games))
+    
+    # Game-player relationships join games generated in the same chunk, so the
+    # games have players instead of every relationship pointing at its own game
+    player_game_ids = iter(rng.choices(game_ids, k=record_types.count(GAME_PLAYER_RECORD)))
+    
+    for record_type in record_types:
+        if record_type == USER_RECORD:  # 60% chance for user records
             records.append(generate_user_record())
-        elif record_type < 0.7:  # 10% chance for game metadata
-            records.append(generate_game_record())
+        elif record_type == GAME_RECORD:  # 10% chance for game metadata
+            game_id, map_name = next(new_games)
+            records.append(generate_game_record(game_id, map_name))
         else:  # 30% chance for game-player relationship
-            # Generate a random game ID
-            game_id = str(uuid.uuid4())
-            records.append(generate_game_player_record(game_id))
+            records.append(generate_game_player_record(next(player_game_ids)))
+    
+    # Shuffle once so each 25-item batch spreads over unrelated partition keys
+    rng.shuffle(records)
     
     return records
 
-def write_batch_to_dynamodb(records):
-    """Write a batch of records to DynamoDB using batch_writer"""
-    global successful_records
-    
-    try:
-        with table.batch_writer() as batch:
-            for record in records:
-                batch.put_item(Item=record)
+def write_requests(requests):
+    """Send put requests with batch_write_item until all are processed or the
+    retries run out. Only unprocessed items are retried, with exponential backoff;
+    a request throttled as a whole is split in two, down to MIN_SPLIT_ITEMS per part.
+    All parts share one retry budget, so splitting does not multiply the calls
+    sent to a throttled table.
+    Returns the number of requests left unprocessed, including requests that
+    failed with any other error.
+    """
+    pending = [requests]
+    unprocessed = 0
+    attempt = 0
+    while pending:
+        requests = pending.pop()
+        try:
+            response = client.batch_write_item(RequestItems={TABLE_NAME: requests})
+            requests = response.get('UnprocessedItems', {}).get(TABLE_NAME)
+            if not requests:
+                continue
+        except ClientError as e:
+            # Throttled requests are retried; any other error fails these requests
+            if e.response.get('Error', {}).get('Code') not in THROTTLING_ERROR_CODES:
+                print(f"Error writing batch to DynamoDB: {e}")
+                unprocessed += len(requests)
+                continue
+            if len(requests) >= 2 * MIN_SPLIT_ITEMS:
+                half = len(requests) // 2
+                pending.append(requests[half:])
+                requests = requests[:half]
+        except Exception as e:
+            print(f"Error writing batch to DynamoDB: {e}")
+            unprocessed += len(requests)
+            continue
         
-        # Update the global counter in a thread-safe way
-        with records_lock:
-            successful_records += len(records)
-            
-        return len(records)
-    except Exception as e:
-        print(f"Error writing batch to DynamoDB: {e}")
-        # Retry logic could be added here
-        return 0
-
-def process_chunk(chunk_id, target_records):
-    """Process a chunk of records"""
-    global successful_records
-    
-    start_time = time.time()
-    records_written = 0
-    
-    # Check if we've already reached the target
-    with records_lock:
-        if successful_records >= target_records:
-            return 0
+        if attempt >= MAX_WRITE_RETRIES:
+            return unprocessed + len(requests) + sum(len(part) for part in pending)
+        time.sleep(min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY))
+        attempt += 1
+        pending.append(requests)
     
-    # Generate records for this chunk
-    chunk_size = min(CHUNK_SIZE, target_records - successful_records)
-    if chunk_size <= 0:
-        return 0
-        
-    records = generate_records(chunk_size)
+    return unprocessed
+
+def write_batch_to_dynamodb(records):
+    """Write a batch of records to DynamoDB using batch_write_item.
+    Batches larger than MAX_BATCH_WRITE_ITEMS are split into several calls.
+    Returns the number of records written.
+    """
+    if len(records) > MAX_BATCH_WRITE_ITEMS:
+        return sum(write_batch_to_dynamodb(records[i:i + MAX_BATCH_WRITE_ITEMS])
+                   for i in range(0, len(records), MAX_BATCH_WRITE_ITEMS))
     
-    # Write records in batches
-    for i in range(0, len(records), BATCH_SIZE):
-        # Check if we've reached the target before processing this batch
-        with records_lock:
-            if successful_records >= target_records:
-                break
-                
-        # Calculate how many more records we need
-        with records_lock:
-            remaining = target_records - successful_records
-            
-        # Adjust batch size to not exceed the target
-        batch = records[i:i+min(BATCH_SIZE, remaining)]
-        if not batch:  # Skip if batch is empty
-            continue
-            
-        records_written += write_batch_to_dynamodb(batch)
-        
-        # Small delay to avoid throttling
-        time.sleep(0.1)
+    # Records are generated as DynamoDB attribute values, so they are sent as is
+    requests = [{'PutRequest': {'Item': record}} for record in records]
     
-    elapsed = time.time() - start_time
-    print(f"Chunk {chunk_id}: Wrote {records_written} records in {elapsed:.2f} seconds")
-    return records_written
+    unprocessed = write_requests(requests)
+    if unprocessed:
+        print(f"Could not write {unprocessed} of {len(records)} records")
+    return len(records) - unprocessed
+
+def generate_batches(num_records):
+    """Generate a chunk of records, already split into BATCH_SIZE-record batches.
+    Runs in a worker process, so the thread feeding the writers only has to queue
+    the batches it receives.
+    Records with a repeated key are dropped, since BatchWriteItem rejects a batch
+    that writes the same item twice and the later one would overwrite it anyway.
+    """
+    records = list({(record["PK"]["S"], record["SK"]["S"]): record
+                    for record in generate_records(num_records)}.values())
+    return [records[i:i + BATCH_SIZE] for i in range(0, len(records), BATCH_SIZE)]
+
+def generate_chunks(generator_pool, chunk_sizes, max_pending):
+    """Yield generated chunks in order, each as a list of batches, keeping at
+    most max_pending chunks generating in the worker processes at once.
+    """
+    pending = deque()
+    for chunk_size in chunk_sizes:
+        pending.append(generator_pool.submit(generate_batches, chunk_size))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def write_batches(write_queue, written_counts, slot):
+    """Write batches from the queue until a None sentinel is received.
+    Each writer thread only updates its own slot of written_counts, which the
+    main thread sums for progress reports.
+    Returns the number of records written.
+    """
+    while True:
+        batch = write_queue.get()
+        if batch is None:
+            return written_counts[slot]
+        written_counts[slot] += write_batch_to_dynamodb(batch)
 
 def main():
     """Main function to generate and insert exactly 1 million records with configurable thread count"""
-    global successful_records
-    successful_records = 0  # Reset counter at start
+    # Only updated here, from the counts returned by the writer threads
+    successful_records = 0
     
     # Parse command line arguments - only threads parameter is configurable
     parser = argparse.ArgumentParser(description='Generate and insert exactly 1 million records into DynamoDB')
     parser.add_argument('--threads', type=int, default=DEFAULT_NUM_THREADS,
                         help=f'Number of concurrent threads to use (default: {DEFAULT_NUM_THREADS})')
+    parser.add_argument('--processes', type=int, default=DEFAULT_NUM_PROCESSES,
+                        help=f'Number of record generator processes to use (default: {DEFAULT_NUM_PROCESSES})')
     args = parser.parse_args()
     
-    # Use the provided thread count, but fix record count to 1 million
+    # Use the provided thread and process counts, but fix record count to 1 million
     num_threads = args.threads
+    num_processes = args.processes
     target_records = TOTAL_RECORDS  # Fixed at 1 million
     
     start_time = time.time()
     
-    print(f"Starting to generate and insert exactly 1,000,000 records using {num_threads} threads...")
+    print(f"Starting to generate and insert exactly 1,000,000 records using {num_threads} threads "
+          f"and {num_processes} generator processes...")
     
-    # Continue processing chunks until we reach the target
-    chunk_id = 0
-    while successful_records < target_records:
-        # Calculate how many chunks to process in parallel
-        remaining = target_records - successful_records
-        num_chunks = min(num_threads, (remaining + CHUNK_SIZE - 1) // CHUNK_SIZE)
-        
-        if num_chunks <= 0:
-            break
+    # Records are generated in worker processes, while the threads in this
+    # process only write them to DynamoDB. Both pools are created once and stay
+    # warm for the whole run.
+    with ProcessPoolExecutor(max_workers=num_processes, initializer=_init_worker) as generator_pool, \
+            ThreadPoolExecutor(max_workers=num_threads) as executor:
+        # Continue until we reach the target; another round only runs for records
+        # whose writes failed in the previous one
+        while successful_records < target_records:
+            remaining = target_records - successful_records
+            num_chunks = (remaining + CHUNK_SIZE - 1) // CHUNK_SIZE
+            chunk_sizes = [min(CHUNK_SIZE, remaining - i * CHUNK_SIZE) for i in range(num_chunks)]
             
-        # Process chunks in parallel
-        with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            futures = [executor.submit(process_chunk, chunk_id + i, target_records) 
-                      for i in range(num_chunks)]
+            # Writer threads take batches from a bounded queue, so generation and
+            # writes overlap and neither waits for the other unless the queue is full
+            write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+            written_counts = [0] * num_threads
+            writers = [executor.submit(write_batches, write_queue, written_counts, slot)
+                       for slot in range(num_threads)]
             
-            # Wait for all futures to complete
-            for future in futures:
-                future.result()
-                
-        chunk_id += num_chunks
-        
-        # Print progress update
-        print(f"Progress: {successful_records}/{target_records} records inserted ({(successful_records/target_records)*100:.2f}%)")
+            # This thread feeds the writers with batches of each generated chunk
+            try:
+                for chunk_id, batches in enumerate(generate_chunks(generator_pool, chunk_sizes, num_processes * 2), 1):
+                    for batch in batches:
+                        write_queue.put(batch)
+                    
+                    # Print progress update
+                    if chunk_id % num_threads == 0:
+                        inserted = successful_records + sum(written_counts)
+                        print(f"Progress: {inserted}/{target_records} records inserted ({(inserted/target_records)*100:.2f}%)")
+            finally:
+                # One sentinel per writer, so the writers stop even if generation failed
+                for _ in writers:
+                    write_queue.put(None)
+            
+            # Count what the writers wrote
+            for writer in writers:
+                successful_records += writer.result()
+            
+            print(f"Progress: {successful_records}/{target_records} records inserted ({(successful_records/target_records)*100:.2f}%)")
     
     elapsed = time.time() - start_time
     print(f"Completed! Wrote exactly {successful_records} records in {elapsed:.2f} seconds")
     print(f"Average rate: {successful_records / elapsed:.2f} records/second")
-    print(f"Using {num_threads} threads")
+    print(f"Using {num_threads} threads and {num_processes} generator processes")
     
     # Final verification
     if successful_records == target_records:
@@ -0,0 +1,175 @@
+"""
+Create the InvertedIndex and OpenGamesIndex GSIs on the battle-royale table.
+
+Run this after create_table_od.py and BEFORE generate_fixed_million_records.py:
+creating a GSI backfills it from every item in the table, so adding the indexes
+while the table is still empty avoids two full backfills over the loaded data.
+
+DynamoDB only accepts one GSI creation per update_table call, so the indexes are
+created one after the other, waiting for each to become ACTIVE.
+
+Combines add_inverted_index.py with add_map_index.py (or add_map_index_optimize.py
+when --optimize is given).
+"""
+import argparse
+import sys
+import time
+
+import boto3
+
+dynamodb = boto3.client('dynamodb')
+
+TABLE_NAME = 'battle-royale'
+MAX_ITEMS_BEFORE_INDEXING = 10000  # Refuse to index a table that has already been loaded
+POLL_INTERVAL = 5  # Seconds between index status checks
+
+INVERTED_INDEX = {
+    "IndexName": "InvertedIndex",
+    "KeySchema": [
+        {
+            "AttributeName": "SK",
+            "KeyType": "HASH"
+        },
+        {
+            "AttributeName": "PK",
+            "KeyType": "RANGE"
+        }
+    ],
+    "Projection": {
+        "ProjectionType": "ALL"
+    }
+}
+
+def open_games_index(sort_key):
+    """
+    Build the OpenGamesIndex definition with map as partition key.
+
+    Parameters:
+    - sort_key: PK (add_map_index.py) or open_timestamp (add_map_index_optimize.py)
+    """
+    return {
+        "IndexName": "OpenGamesIndex",
+        "KeySchema": [
+            {
+                "AttributeName": "map",
+                "KeyType": "HASH"
+            },
+            {
+                "AttributeName": sort_key,
+                "KeyType": "RANGE"
+            }
+        ],
+        "Projection": {
+            "ProjectionType": "ALL"
+        }
+    }
+
+def describe_indexes():
+    """Return the table description and the status of each GSI, keyed by index name."""
+    table = dynamodb.describe_table(TableName=TABLE_NAME)['Table']
+    return table, {gsi['IndexName']: gsi['IndexStatus'] for gsi in table.get('GlobalSecondaryIndexes', [])}
+
+def wait_for_table():
+    """Wait until the table is ACTIVE, so update_table is not rejected while it is still updating."""
+    dynamodb.get_waiter('table_exists').wait(TableName=TABLE_NAME)
+    while True:
+        table, _ = describe_indexes()
+        if table['TableStatus'] == 'ACTIVE':
+            return
+        print(f"Waiting for table {TABLE_NAME} (table {table['TableStatus']})...")
+        time.sleep(POLL_INTERVAL)
+
+def wait_for_index(index_name):
+    """
+    Wait until the table and the given GSI are both ACTIVE.
+
+    Parameters:
+    - index_name: Name of the GSI being created
+    """
+    dynamodb.get_waiter('table_exists').wait(TableName=TABLE_NAME)
+    while True:
+        table, statuses = describe_indexes()
+        if table['TableStatus'] == 'ACTIVE' and statuses.get(index_name) == 'ACTIVE':
+            return
+        print(f"Waiting for {index_name} (table {table['TableStatus']}, index {statuses.get(index_name)})...")
+        time.sleep(POLL_INTERVAL)
+
+def create_index(index, attribute_definitions):
+    """
+    Create one GSI and wait for it to become ACTIVE.
+    An index that already exists is not created again; the script waits for it
+    if it is still being built and moves on to the next index.
+
+    Parameters:
+    - index: The GSI definition
+    - attribute_definitions: Definitions of the attributes used in the index key schema
+    """
+    status = describe_indexes()[1].get(index["IndexName"])
+    if status is not None:
+        print(f"{index['IndexName']} already exists ({status}), skipping creation.")
+        if status != 'ACTIVE':
+            wait_for_index(index["IndexName"])
+        return
+
+    wait_for_table()
+    dynamodb.update_table(
+        TableName=TABLE_NAME,
+        AttributeDefinitions=attribute_definitions,
+        BillingMode='PAY_PER_REQUEST',
+        GlobalSecondaryIndexUpdates=[
+            {
+                "Create": index
+            }
+        ]
+    )
+    wait_for_index(index["IndexName"])
+    print(f"Created {index['IndexName']}.")
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the battle-royale GSIs before loading data')
+    parser.add_argument('--optimize', action='store_true',
+                        help='Use open_timestamp instead of PK as the OpenGamesIndex sort key')
+    parser.add_argument('--force', action='store_true',
+                        help='Create the indexes even if the table already holds data')
+    args = parser.parse_args()
+
+    try:
+        # ItemCount is only refreshed about every six hours, but is enough to catch
+        # a table that has already been loaded
+        table, statuses = describe_indexes()
+        missing = {INVERTED_INDEX["IndexName"], "OpenGamesIndex"} - statuses.keys()
+        item_count = table.get('ItemCount', 0)
+        if missing and item_count > MAX_ITEMS_BEFORE_INDEXING and not args.force:
+            print(f"Table already holds about {item_count} items; creating the indexes now would backfill them.")
+            print("Run this script before loading data, or pass --force.")
+            sys.exit(1)
+
+        create_index(INVERTED_INDEX, [
+            {
+                "AttributeName": "PK",
+                "AttributeType": "S"
+            },
+            {
+                "AttributeName": "SK",
+                "AttributeType": "S"
+            }
+        ])
+
+        sort_key = "open_timestamp" if args.optimize else "PK"
+        create_index(open_games_index(sort_key), [
+            {
+                "AttributeName": "map",
+                "AttributeType": "S"
+            },
+            {
+                "AttributeName": sort_key,
+                "AttributeType": "S"
+            }
+        ])
+        print("Table updated successfully.")
+    except Exception as e:
+        print("Could not update table. Error:")
+        print(e)
+
+if __name__ == "__main__":
+    main()